@@ -4,6 +4,15 @@ __author__ = "FUJITAKE Masato and Fast Accounting Co., Ltd."
 __url__ = "https://github.com/FastAccounting/nobunaga"
 
 
-from nobunaga import (constants, evaluator, image_printer, io, labels, utils)
+from nobunaga import (
+    constants,
+    evaluator,
+    image_printer,
+    io,
+    labels,
+    partial_result,
+    result_cache,
+    utils,
+)
 
 __all__ = list(globals().keys())
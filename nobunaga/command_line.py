@@ -1,22 +1,63 @@
 import argparse
 import os.path
+from pathlib import Path
 
 import nobunaga.constants as Const
 from nobunaga.evaluator import Evaluator
-from nobunaga.image_printer import ImagePrinter
-from nobunaga.io import GtJson, PredJson
+from nobunaga.image_printer import ImagePrinter, output_threshold_summary
+from nobunaga.io import GtJson, PredJson, iter_json_lines_groups
+from nobunaga.partial_result import PartialResult, get_shard_image_ids
+from nobunaga.result_cache import ResultCache
 
 
 def arg():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command", nargs="?", choices=["evaluate", "shard", "merge", "convert"], default="evaluate"
+    )
     parser.add_argument("--gt", "-g", type=str, default="test/jsons/gt_coco.json", required=False)
-    parser.add_argument("--pred", "-p", type=str, default="test/jsons/pred_coco.json", required=False)
+    parser.add_argument(
+        "--pred", "-p", type=str, nargs="+", default=["test/jsons/pred_coco.json"], required=False
+    )
     parser.add_argument("--image_dir", "-d", type=str, default="test/images/", required=False)
     parser.add_argument("--iou_threshold", "-i", type=float, default=0.5)
+    parser.add_argument("--iou_thresholds", type=float, nargs="+", default=None)
     parser.add_argument("--confidence_threshold", "-c", type=float, default=0.7)
+    parser.add_argument("--confidence_thresholds", type=float, nargs="+", default=None)
+    parser.add_argument(
+        "--sparse_box_count", type=int, default=Const.THRESHOLD_SPARSE_IOU_BOX_COUNT
+    )
     parser.add_argument("--model_name", "-m", type=str, default="")
+    parser.add_argument("--workers", type=int, default=1)
+    # read predictions without loading the whole json, only the fields used are kept
+    parser.add_argument("--stream_pred", action="store_true")
+    # json lines grouped by image_id, each image is matched as soon as it is read
+    parser.add_argument("--grouped_pred", action="store_true")
+    # predictions dropped while reading
+    parser.add_argument("--min_score", type=float, default=None)
+    parser.add_argument("--max_per_image", type=int, default=None)
+    parser.add_argument("--max_per_category", type=int, default=None)
     parser.add_argument("--normalize", type=bool, default=False)
     parser.add_argument("--output_image", "-o", default=False)
+    # processes writing error images
+    parser.add_argument("--render_workers", type=int, default=1)
+    # images decoded ahead of drawing and waiting to be written, per render worker
+    parser.add_argument("--decode_queue_size", type=int, default=Const.RENDER_DECODE_QUEUE_SIZE)
+    parser.add_argument("--write_queue_size", type=int, default=Const.RENDER_WRITE_QUEUE_SIZE)
+    # longer side of error images in pixels, jpeg is decoded at the reduced size
+    parser.add_argument("--render_max_side", type=int, default=None)
+    # per-label OCC and the label table as parquet too, needs pyarrow
+    parser.add_argument("--parquet", action="store_true")
+    # shard: evaluate a part of the images, merge: output the results of all parts
+    parser.add_argument("--shard_index", type=int, default=0)
+    parser.add_argument("--shard_count", type=int, default=1)
+    parser.add_argument("--partial", type=str, default="partial.npz")
+    parser.add_argument("--partials", type=str, nargs="+", default=None)
+    parser.add_argument("--no_label_table", action="store_true")
+    # results of the same inputs and thresholds are reused
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--cache_dir", type=str, default=Const.CACHE_DIR)
+    parser.add_argument("--cache_size", type=int, default=Const.CACHE_MAX_SIZE_MB, help="MB")
     args = parser.parse_args()
 
     error_args_name = ""
@@ -24,9 +65,10 @@ def arg():
     if not os.path.exists(args.gt):
         error_args_name = "gt"
         error_args_value = args.gt
-    if not os.path.exists(args.pred):
-        error_args_name = "pred"
-        error_args_value = args.pred
+    for pred in args.pred:
+        if not os.path.exists(pred):
+            error_args_name = "pred"
+            error_args_value = pred
     if not os.path.exists(args.image_dir):
         error_args_name = "image_dir"
         error_args_value = args.image_dir
@@ -47,6 +89,53 @@ def arg():
         ))
         exit()
 
+    for arg_name in ["max_per_image", "max_per_category"]:
+        value = getattr(args, arg_name)
+        if value is not None and value < 1:
+            print(f"'{arg_name}' : '{value}' has to be 1 or more.")
+            exit()
+
+    # several prediction files or directories of them are compared against the same gt
+    args.preds = []
+    for pred in args.pred:
+        if os.path.isdir(pred):
+            pred_paths = [
+                path
+                for suffix in [".json", Const.JSON_LINES_SUFFIX, Const.BINARY_SUFFIX]
+                + Const.TABLE_SUFFIXES
+                for path in Path(pred).glob("*" + suffix)
+            ]
+            args.preds.extend(sorted(str(path) for path in pred_paths))
+        else:
+            args.preds.append(pred)
+    if len(args.preds) == 0:
+        print(f"'pred' : '{args.pred}' has no prediction file.")
+        exit()
+    # names of the outputs of each model, unique among the prediction files
+    args.pred_names = get_pred_names(args.preds)
+    if len(set(args.pred_names)) != len(args.pred_names):
+        print(f"'pred' : '{args.preds}' has prediction files of the same output name.")
+        exit()
+    is_sweep = args.iou_thresholds or args.confidence_thresholds
+    if len(args.preds) > 1 and (args.command not in ["evaluate", "convert"] or is_sweep):
+        print("several 'pred' files can not be used with threshold sweeps, shard or merge.")
+        exit()
+    args.pred = args.preds[0]
+    if args.grouped_pred and (
+        len(args.preds) > 1
+        or args.command != "evaluate"
+        or is_sweep
+        or not args.pred.endswith(Const.JSON_LINES_SUFFIX)
+    ):
+        print("'grouped_pred' needs one json lines 'pred' file without sweeps, shard or merge.")
+        exit()
+    args.pred_options = {
+        "streaming": args.stream_pred,
+        "min_score": args.min_score,
+        "max_per_image": args.max_per_image,
+        "max_per_category": args.max_per_category,
+    }
+
     for arg_name, value in vars(args).items():
         print(f"{arg_name.ljust(21)}: {value}")
     return args
@@ -55,25 +144,192 @@ def arg():
 def main():
     args = arg()
 
+    # save gt and preds as columns next to them, they can be passed instead of the json files
+    if args.command == "convert":
+        GtJson(args.gt).save_binary(str(Path(args.gt).with_suffix(Const.BINARY_SUFFIX)))
+        for pred_path in args.preds:
+            if pred_path.endswith(Const.BINARY_SUFFIX):
+                continue
+            pred = PredJson(pred_path, **args.pred_options)
+            pred.save_binary(str(Path(pred_path).with_suffix(Const.BINARY_SUFFIX)))
+        return
+
+    # compare models with one gt, each model is evaluated in its own worker process
+    if len(args.preds) > 1:
+        gt = GtJson(args.gt)
+        evaluations = Evaluator.iter_by_preds(
+            gt,
+            args.preds,
+            args.iou_threshold,
+            args.confidence_threshold,
+            args.sparse_box_count,
+            workers=args.workers,
+            pred_options=args.pred_options,
+        )
+        # only the summary of a model is kept after its outputs are written
+        summaries = {}
+        for pred_name, (_, evaluation) in zip(args.pred_names, evaluations):
+            model_name = f"{args.model_name}_{pred_name}"
+            output(args, model_name, evaluation)
+            summaries[pred_name] = evaluation.get_summary()
+        output_threshold_summary(args.model_name, summaries, "model")
+        return
+
+    # skip reading and evaluation when the same evaluation is cached
+    cache = None
+    if (
+        args.command == "evaluate"
+        and not args.iou_thresholds
+        and not args.confidence_thresholds
+        and args.cache
+    ):
+        cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        cache_key = cache.get_key(
+            args.gt,
+            args.pred,
+            [
+                args.iou_threshold,
+                args.confidence_threshold,
+                args.min_score,
+                args.max_per_image,
+                args.max_per_category,
+            ],
+        )
+        evaluation = cache.load(cache_key, args.sparse_box_count)
+        if evaluation is not None:
+            output(args, args.model_name, evaluation)
+            return
+
     # read coco json file
     gt = GtJson(args.gt)
-    pred = PredJson(args.pred)
-    evaluation = Evaluator(gt, pred, args.iou_threshold, args.confidence_threshold)
-    categories = gt.get_categories()
 
-    printer = ImagePrinter(args.model_name, categories, evaluation, args.image_dir)
+    # images are matched while the predictions are still read
+    if args.grouped_pred:
+        evaluation = Evaluator.create_by_pred_stream(
+            gt,
+            iter_json_lines_groups(args.pred),
+            args.iou_threshold,
+            args.confidence_threshold,
+            args.sparse_box_count,
+            workers=args.workers,
+            pred_options=args.pred_options,
+        )
+        if cache is not None:
+            cache.save(cache_key, evaluation)
+        output(args, args.model_name, evaluation)
+        return
+
+    pred = PredJson(args.pred, **args.pred_options)
+
+    # evaluate one shard of the images and save the partial result
+    if args.command == "shard":
+        evaluation = Evaluator(
+            gt,
+            pred,
+            args.iou_threshold,
+            args.confidence_threshold,
+            args.sparse_box_count,
+            workers=args.workers,
+            image_ids=get_shard_image_ids(gt, args.shard_index, args.shard_count),
+        )
+        partial_result = PartialResult.from_evaluator(
+            evaluation,
+            list(evaluation.get_categories().keys()),
+            with_label_table=not args.no_label_table,
+        )
+        partial_result.save(args.partial)
+        return
+
+    # merge partial results of all shards as if evaluated at once
+    if args.command == "merge":
+        partial_result = PartialResult.merge(
+            [PartialResult.load(file_path) for file_path in args.partials or [args.partial]]
+        )
+        if not partial_result.has_label_table():
+            # only the summary is left without label tables
+            summaries = {partial_result.get_iou_threshold(): partial_result.get_summary()}
+            output_threshold_summary(args.model_name, summaries, "iou_threshold")
+            return
+        evaluation = partial_result.to_evaluator(gt, pred, args.sparse_box_count)
+        output(args, args.model_name, evaluation)
+        return
+
+    # evaluate several iou thresholds with one iou calculation per image
+    if args.iou_thresholds:
+        evaluations = Evaluator.create_by_iou_thresholds(
+            gt, pred, args.iou_thresholds, args.confidence_threshold, args.sparse_box_count
+        )
+        for iou_threshold, evaluation in evaluations.items():
+            model_name = f"{args.model_name}_iou{iou_threshold}"
+            output(args, model_name, evaluation)
+        summaries = {
+            iou_threshold: evaluation.get_summary()
+            for iou_threshold, evaluation in evaluations.items()
+        }
+        output_threshold_summary(args.model_name, summaries, "iou_threshold")
+        return
+
+    # error distribution curve over confidence thresholds without error outputs
+    if args.confidence_thresholds:
+        summaries = Evaluator.sweep_confidence_thresholds(
+            gt, pred, args.iou_threshold, args.confidence_thresholds, args.sparse_box_count
+        )
+        output_threshold_summary(args.model_name, summaries, "confidence_threshold")
+        return
+
+    evaluation = Evaluator(
+        gt,
+        pred,
+        args.iou_threshold,
+        args.confidence_threshold,
+        args.sparse_box_count,
+        workers=args.workers,
+    )
+    if cache is not None:
+        cache.save(cache_key, evaluation)
+    output(args, args.model_name, evaluation)
+
+
+def get_pred_names(pred_paths: list):
+    """
+    file name of each prediction file without suffix. when two files have the same name,
+    the path from their common parent, e.g. a_model for a/model.json and b_model for
+    b/model.json, with the suffix too when it differs, e.g. x.json and x.jsonl.
+    """
+    names = [Path(pred_path).stem for pred_path in pred_paths]
+    if len(set(names)) == len(names):
+        return names
+    paths = [Path(pred_path).resolve() for pred_path in pred_paths]
+    common_dir = Path(os.path.commonpath([str(path.parent) for path in paths]))
+    relative_paths = [path.relative_to(common_dir) for path in paths]
+    names = ["_".join(path.with_suffix("").parts) for path in relative_paths]
+    if len(set(names)) == len(names):
+        return names
+    return ["_".join(path.parts) for path in relative_paths]
+
+
+def output(args: argparse.Namespace, model_name: str, evaluation: Evaluator):
+    # categories of the evaluation, with the ones only predicted by this model
+    printer = ImagePrinter(model_name, evaluation.get_categories(), evaluation, args.image_dir)
     printer.output_error_summary()
     printer.output_error_type_detail(args.normalize, mode=["confusion_matrix", "strip"])
     printer.output_correction_distance_csv_per_file()
     printer.output_correction_distance_csv_per_label()
     printer.output_confusion_matrix(args.normalize)
+    if args.parquet:
+        printer.output_correction_distance_parquet_per_label()
+        printer.output_label_table_parquet()
 
     # if you set argument -o you can output error images.
     if args.output_image:
         # normally we don't need this
         # printer.output_correction_distance_files()
-        for error_type in Const.MAIN_ERRORS:
-            printer.output_error_files(error_type)
+        printer.output_all_error_files(
+            args.render_workers,
+            args.decode_queue_size,
+            args.write_queue_size,
+            args.render_max_side,
+        )
 
 
 if __name__ == "__main__":
@@ -30,3 +30,30 @@ SPECIAL_ERRORS = [
 
 # threshold
 THRESHOLD_MIN_DETECTED = 0.2
+# images with more pred and gt boxes than this use the sparse iou path
+THRESHOLD_SPARSE_IOU_BOX_COUNT = 2000
+
+# result cache, used only with --cache
+CACHE_DIR = "~/.cache/nobunaga"
+CACHE_MAX_SIZE_MB = 1024
+
+# columnar gt and pred files made by the convert command
+BINARY_SUFFIX = ".nobunaga"
+
+# one prediction or one image per line
+JSON_LINES_SUFFIX = ".jsonl"
+
+# parquet and arrow tables, one annotation per row
+TABLE_SUFFIXES = [".parquet", ".arrow", ".feather"]
+
+# decoded images kept while writing error images
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# threads decoding source images ahead of drawing and writing drawn images behind it,
+# and the number of images each of them holds at most
+RENDER_DECODE_WORKERS = 2
+RENDER_DECODE_QUEUE_SIZE = 8
+RENDER_WRITE_WORKERS = 2
+RENDER_WRITE_QUEUE_SIZE = 8
+# images written by a worker at once
+RENDER_CHUNK_SIZE = 16
@@ -1,54 +1,407 @@
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import nobunaga.constants as Const
 from nobunaga.io import GtJson, PredJson
-from nobunaga.labels import Image
+from nobunaga.io.binary_annotations import save_binary_annotations
+from nobunaga.labels import Image, LabelTable, calculate_image_ious
+from nobunaga.labels.label_table import CORRECT_DISTANCE_SIZE
+
+# Cls, Loc, Both, Dupe, Bkg, Miss, FP, FN, TP
+SUMMARY_COUNT_SIZE = 9
+# images matched together by create_by_pred_stream
+STREAM_BATCH_SIZE = 64
 
 
 class Evaluator(object):
     def __init__(
-        self, gt: GtJson, pred: PredJson, iou_threshold: float, confidence_threshold: float
+        self,
+        gt: GtJson,
+        pred: PredJson,
+        iou_threshold: float,
+        confidence_threshold: float,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+        images: list = None,
+        workers: int = 1,
+        lazy: bool = False,
+        image_ids: list = None,
+        label_tables: list = None,
     ):
         self._gt = gt
         self._pred = pred
+        # gt categories and the ones only predicted, e.g. of a gt table without them
+        self._categories = _merge_categories(gt.get_categories(), pred.get_categories())
         self._images = []
         self._iou_threshold = iou_threshold
         self._confidence_threshold = confidence_threshold
-        for image_id, gt_annotation in self._gt.get_annotations().items():
-            image = self._gt.get_image_by_image_id(image_id)
-            pred_annotation = self._pred.get_annotation_by_image_id(image_id)
-            image = Image(
-                image,
-                self._gt.get_categories(),
-                gt_annotation,
-                pred_annotation,
+
+        # aggregates of all labels, built on first use
+        self._image_summaries = None
+        self._summary_total = None
+        self._label_table = None
+        self._error_index = None
+        self._error_count_matrix = None
+        self._error_count_category_ids = None
+
+        # images already matched with the same thresholds
+        self._sparse_box_count = sparse_box_count
+        self._annotation_image_ids = [image.get_image_id() for image in images or []]
+        if images is None:
+            self._annotation_image_ids = list(self._gt.get_annotations().keys())
+            if image_ids is not None:
+                # evaluate only a part of the images, e.g. one shard
+                image_ids = set(image_ids)
+                self._annotation_image_ids = [
+                    image_id for image_id in self._annotation_image_ids if image_id in image_ids
+                ]
+            if lazy:
+                # matched on first access
+                images = [None for _ in self._annotation_image_ids]
+            else:
+                images = self._create_images(workers, label_tables)
+        self._images = images
+
+        # relation dict between image id and position in images
+        self._image_position_relations = {}
+        for position, image in enumerate(self._images):
+            if image is not None:
+                image_id = image.get_image_id()
+            else:
+                image_id = self._gt.get_image_by_image_id(self._annotation_image_ids[position]).get(
+                    "id", -1
+                )
+            self._image_position_relations.setdefault(image_id, position)
+
+    @staticmethod
+    def create_by_iou_thresholds(
+        gt: GtJson,
+        pred: PredJson,
+        iou_thresholds: list,
+        confidence_threshold: float,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+    ):
+        """
+        one Evaluator per iou threshold. iou of each image is calculated only once.
+        """
+        images = {iou_threshold: [] for iou_threshold in iou_thresholds}
+        for image_id, gt_annotation in gt.get_annotations().items():
+            pred_annotation = pred.get_annotation_by_image_id(image_id)
+            gt_arrays = gt.get_image_arrays(image_id)
+            iou = calculate_image_ious(
+                gt_annotation, pred_annotation, sparse_box_count, gt_arrays[0]
+            )
+            for iou_threshold in iou_thresholds:
+                image = Image(
+                    gt.get_image_by_image_id(image_id),
+                    gt.get_categories(),
+                    gt_annotation,
+                    pred_annotation,
+                    iou_threshold,
+                    confidence_threshold,
+                    sparse_box_count,
+                    iou,
+                    gt_arrays=gt_arrays,
+                )
+                images[iou_threshold].append(image)
+
+        evaluations = {}
+        for iou_threshold in iou_thresholds:
+            evaluations[iou_threshold] = Evaluator(
+                gt,
+                pred,
                 iou_threshold,
                 confidence_threshold,
+                sparse_box_count,
+                images[iou_threshold],
+            )
+        return evaluations
+
+    @staticmethod
+    def sweep_confidence_thresholds(
+        gt: GtJson,
+        pred: PredJson,
+        iou_threshold: float,
+        confidence_thresholds: list,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+    ):
+        """
+        get_summary() of each confidence threshold without keeping any Evaluator.
+        iou of each image is calculated once, and the image is matched again only when
+        one of its prediction scores lies between two consecutive thresholds.
+        """
+        confidence_thresholds = sorted(confidence_thresholds)
+        summaries = [None for _ in confidence_thresholds]
+        for image_id, gt_annotation in gt.get_annotations().items():
+            pred_annotation = pred.get_annotation_by_image_id(image_id)
+            gt_arrays = gt.get_image_arrays(image_id)
+            iou = calculate_image_ious(
+                gt_annotation, pred_annotation, sparse_box_count, gt_arrays[0]
+            )
+            scores = np.sort([pred.get("score", -1) for pred in pred_annotation])
+            image_summary = None
+            for index, confidence_threshold in enumerate(confidence_thresholds):
+                if image_summary is None or np.searchsorted(
+                    scores, confidence_thresholds[index - 1], side="left"
+                ) != np.searchsorted(scores, confidence_threshold, side="right"):
+                    image = Image(
+                        gt.get_image_by_image_id(image_id),
+                        gt.get_categories(),
+                        gt_annotation,
+                        pred_annotation,
+                        iou_threshold,
+                        confidence_threshold,
+                        sparse_box_count,
+                        iou,
+                        gt_arrays=gt_arrays,
+                    )
+                    image_summary = image.get_summary()
+                if summaries[index] is None:
+                    summaries[index] = image_summary
+                else:
+                    summaries[index] = [x + y for x, y in zip(summaries[index], image_summary)]
+
+        sweep = {}
+        for confidence_threshold, summary in zip(confidence_thresholds, summaries):
+            sweep[confidence_threshold] = summary if summary is not None else _empty_summary()
+        return sweep
+
+    @staticmethod
+    def iter_by_preds(
+        gt: GtJson,
+        pred_paths: list,
+        iou_threshold: float,
+        confidence_threshold: float,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+        workers: int = 1,
+        pred_options: dict = None,
+    ):
+        """
+        yield (pred_path, Evaluator) of each prediction file in order, evaluated in parallel
+        against the same gt. gt arrays are created once and shared by the worker processes.
+        pred_options are keyword arguments of PredJson.
+        only one prediction file is read at a time when workers <= 1. workers send back
+        the label tables and the predictions of the gt images saved as a .nobunaga file,
+        which the Evaluator maps instead of holding them in memory.
+        each Evaluator is meant to be used before the next one is taken.
+        """
+        pred_options = pred_options or {}
+        for image_id in gt.get_annotations().keys():
+            gt.get_image_arrays(image_id)
+        if workers <= 1 or len(pred_paths) <= 1:
+            for pred_path in pred_paths:
+                pred = PredJson(pred_path, **pred_options)
+                yield pred_path, Evaluator(
+                    gt, pred, iou_threshold, confidence_threshold, sparse_box_count
+                )
+            return
+
+        with tempfile.TemporaryDirectory() as pred_dir:
+            evaluate_pred_file = partial(
+                _evaluate_pred_file,
+                iou_threshold=iou_threshold,
+                confidence_threshold=confidence_threshold,
+                sparse_box_count=sparse_box_count,
+                pred_options=pred_options,
             )
-            self._images.append(image)
+            binary_paths = [
+                os.path.join(pred_dir, f"{index}{Const.BINARY_SUFFIX}")
+                for index in range(len(pred_paths))
+            ]
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_set_shared_gt, initargs=(gt,)
+            ) as executor:
+                results = executor.map(evaluate_pred_file, pred_paths, binary_paths)
+                for pred_path, binary_path, label_tables in zip(pred_paths, binary_paths, results):
+                    yield pred_path, Evaluator(
+                        gt,
+                        PredJson(binary_path),
+                        iou_threshold,
+                        confidence_threshold,
+                        sparse_box_count,
+                        label_tables=label_tables,
+                    )
+
+    @staticmethod
+    def create_by_pred_stream(
+        gt: GtJson,
+        pred_groups,
+        iou_threshold: float,
+        confidence_threshold: float,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+        workers: int = 1,
+        pred_options: dict = None,
+    ):
+        """
+        pred_groups yields (image_id, predictions) with all predictions of an image at once,
+        e.g. iter_json_lines_groups of a file grouped by image_id.
+        images are matched while the rest is still read, in worker processes when workers > 1.
+        """
+        pred = PredJson(**(pred_options or {}))
+        create_label_tables = partial(
+            _create_label_tables,
+            categories=gt.get_categories(),
+            iou_threshold=iou_threshold,
+            confidence_threshold=confidence_threshold,
+            sparse_box_count=sparse_box_count,
+        )
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        batches = []
+        image_ids = []
+        image_annotations = []
+        read_image_ids = set()
+        try:
+            for image_id, annotations in pred_groups:
+                if image_id in read_image_ids:
+                    raise ValueError(f"predictions of image {image_id} are not grouped.")
+                read_image_ids.add(image_id)
+                pred.add_annotation_list(annotations)
+                if image_id not in gt.get_annotations():
+                    continue
+                image_ids.append(image_id)
+                image_annotations.append(
+                    (
+                        gt.get_image_by_image_id(image_id),
+                        gt.get_annotation_by_image_id(image_id),
+                        pred.get_annotation_by_image_id(image_id),
+                    )
+                )
+                if len(image_annotations) == STREAM_BATCH_SIZE:
+                    result = _submit(executor, create_label_tables, image_annotations)
+                    batches.append((image_ids, result))
+                    image_ids = []
+                    image_annotations = []
+            if len(image_annotations) > 0:
+                result = _submit(executor, create_label_tables, image_annotations)
+                batches.append((image_ids, result))
+
+            label_tables = {}
+            for batch_image_ids, result in batches:
+                if executor is not None:
+                    result = result.result()
+                label_tables.update(zip(batch_image_ids, result))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # images without predictions are matched here
+        return Evaluator(
+            gt,
+            pred,
+            iou_threshold,
+            confidence_threshold,
+            sparse_box_count,
+            label_tables=[label_tables.get(image_id) for image_id in gt.get_annotations().keys()],
+        )
+
+    def _create_images(self, workers: int, label_tables: list = None):
+        # labels already matched elsewhere, e.g. by iter_by_preds
+        if label_tables is None:
+            label_tables = self._match_images(workers)
+        images = []
+        for image_id, label_table in zip(self._annotation_image_ids, label_tables):
+            images.append(self._create_image(image_id, label_table))
+        return images
+
+    def _match_images(self, workers: int):
+        # match shards of images in worker processes, only label tables come back
+        label_tables = [None for _ in self._annotation_image_ids]
+        if workers > 1 and len(self._annotation_image_ids) > 1:
+            image_annotations = [
+                (
+                    self._gt.get_image_by_image_id(image_id),
+                    self._gt.get_annotation_by_image_id(image_id),
+                    self._pred.get_annotation_by_image_id(image_id),
+                )
+                for image_id in self._annotation_image_ids
+            ]
+            shard_size = math.ceil(len(image_annotations) / (workers * 4))
+            shards = [
+                image_annotations[start : start + shard_size]
+                for start in range(0, len(image_annotations), shard_size)
+            ]
+            create_label_tables = partial(
+                _create_label_tables,
+                categories=self._categories,
+                iou_threshold=self._iou_threshold,
+                confidence_threshold=self._confidence_threshold,
+                sparse_box_count=self._sparse_box_count,
+            )
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                label_tables = [
+                    label_table
+                    for shard_label_tables in executor.map(create_label_tables, shards)
+                    for label_table in shard_label_tables
+                ]
+        return label_tables
+
+    def _create_image(self, image_id: int, label_table: LabelTable = None):
+        # gt arrays are only needed, and cached by the gt, when the image is matched here
+        gt_arrays = None
+        if label_table is None:
+            gt_arrays = self._gt.get_image_arrays(image_id)
+        return Image(
+            self._gt.get_image_by_image_id(image_id),
+            self._categories,
+            self._gt.get_annotation_by_image_id(image_id),
+            self._pred.get_annotation_by_image_id(image_id),
+            self._iou_threshold,
+            self._confidence_threshold,
+            self._sparse_box_count,
+            label_table=label_table,
+            gt_arrays=gt_arrays,
+        )
+
+    def _get_image(self, position: int):
+        if self._images[position] is None:
+            self._images[position] = self._create_image(self._annotation_image_ids[position])
+        return self._images[position]
+
+    def get_image_ids(self):
+        return list(self._annotation_image_ids)
 
     def get_images(self):
-        return self._images
+        return [self._get_image(position) for position in range(len(self._images))]
+
+    def iter_images(self):
+        for position in range(len(self._images)):
+            yield self._get_image(position)
 
     def get_image_by_image_id(self, image_id: int):
-        for image in self._images:
-            if image.get_image_id() == image_id:
-                return image
-        return None
+        position = self._image_position_relations.get(image_id)
+        if position is None:
+            return None
+        return self._get_image(position)
+
+    def get_image_position_by_image_id(self, image_id: int):
+        return self._image_position_relations.get(image_id, -1)
 
     def get_all_labels(self):
         labels = []
-        for image in self._images:
+        for image in self.iter_images():
             for label in image.get_labels():
                 labels.append(label)
         return labels
 
+    def get_label_table(self):
+        return LabelTable.concatenate([image.get_label_table() for image in self.iter_images()])
+
     def get_true_positive_by_category_id(self, category_id: int):
         true_positive_count = 0
-        for image in self._images:
+        for image in self.iter_images():
             true_positive_count += image.get_true_positive_count_by_category_id(category_id)
         return true_positive_count
 
     def get_gt(self):
         return self._gt
 
+    def get_categories(self):
+        return self._categories
+
     def get_pred(self):
         return self._pred
 
@@ -62,135 +415,294 @@ class Evaluator(object):
         return self._confidence_threshold
 
     def get_main_error_distribution(self):
-        class_error = len(self.get_class_errors())
-        location_error = len(self.get_location_errors())
-        both_error = len(self.get_both_errors())
-        duplicate_error = len(self.get_duplicate_errors())
-        background_error = len(self.get_background_errors())
-        miss_error = len(self.get_miss_errors())
-        error_distribution = [
-            class_error,
-            location_error,
-            both_error,
-            duplicate_error,
-            background_error,
-            miss_error,
-        ]
-        return error_distribution
+        return self.get_summary()[: len(Const.MAIN_ERRORS)]
 
     def get_special_error_distribution(self):
-        false_positive = self.get_false_positive_count()
-        false_negative = self.get_false_negative_count()
-        error_rate = [
-            false_positive,
-            false_negative,
-        ]
-        return error_rate
+        error_count = len(Const.MAIN_ERRORS)
+        return self.get_summary()[error_count : error_count + len(Const.SPECIAL_ERRORS)]
+
+    def get_correct_distance(self):
+        """
+        [Cls, Loc, Both, Dupe, Bkg, Miss, No Error, All Errors] of all images
+        """
+        return self.get_summary()[SUMMARY_COUNT_SIZE:]
+
+    def get_summary(self):
+        """
+        [Cls, Loc, Both, Dupe, Bkg, Miss, FP, FN, TP] counts followed by get_correct_distance()
+        """
+        if len(self._images) == 0:
+            return _empty_summary()
+        summary = self._get_summary_total().tolist()
+        counts = [int(count) for count in summary[:SUMMARY_COUNT_SIZE]]
+        return counts + summary[SUMMARY_COUNT_SIZE:]
 
     def get_false_positive_count(self):
-        false_positive_count = 0
-        for image in self._images:
-            false_positive_count = false_positive_count + image.get_false_positive_count()
-        return false_positive_count
+        return self.get_summary()[len(Const.MAIN_ERRORS)]
 
     def get_true_positive_count(self):
-        true_positive_count = 0
-        for image in self._images:
-            true_positive_count = true_positive_count + image.get_true_positive_count()
-        return true_positive_count
+        return self.get_summary()[SUMMARY_COUNT_SIZE - 1]
 
     def get_false_negative_count(self):
-        false_negative_count = 0
-        for image in self._images:
-            false_negative_count = false_negative_count + image.get_false_negative_count()
-        return false_negative_count
+        return self.get_summary()[len(Const.MAIN_ERRORS) + 1]
+
+    def get_duplicate_count(self):
+        duplicate_count = 0
+        for image in self.iter_images():
+            duplicate_count += int(image.get_duplicate_counts().sum())
+        return duplicate_count
+
+    def get_duplicate_counts_by_image_id(self):
+        duplicate_counts = {}
+        for image in self.iter_images():
+            duplicate_counts[image.get_image_id()] = image.get_duplicate_counts()
+        return duplicate_counts
+
+    def get_errors(self, error_type: str):
+        image_positions, rows, _ = self._get_error_index()[error_type]
+        return [
+            self._images[position].get_label(row) for position, row in zip(image_positions, rows)
+        ]
+
+    def get_errors_by_category_id(self, error_type: str, category_id: int):
+        image_positions, rows, pred_category_ids = self._get_error_index()[error_type]
+        is_category = pred_category_ids == category_id
+        return [
+            self._images[position].get_label(row)
+            for position, row in zip(image_positions[is_category], rows[is_category])
+        ]
+
+    def get_error_count(self, error_type: str):
+        return self.get_summary()[Const.MAIN_ERRORS.index(error_type)]
+
+    def add_predictions(self, image_id: int, preds: list):
+        """
+        add predictions of an image and match only this image again.
+        """
+        self._pred.add_annotations(image_id, preds)
+        position = self._image_position_relations.get(image_id)
+        if position is None or self._images[position] is None:
+            # no gt, or lazy image which is matched with all predictions on first access
+            return
+        image = self._create_image(self._annotation_image_ids[position])
+        self._images[position] = image
+        if self._image_summaries is not None:
+            image_summary = np.asarray(image.get_summary(), dtype=np.float64)
+            if self._summary_total is not None:
+                # only this image changes, the other images are not summed again
+                self._summary_total -= self._image_summaries[position]
+                self._summary_total += image_summary
+            self._image_summaries[position] = image_summary
+        self._label_table = None
+        self._error_index = None
+        self._error_count_matrix = None
+
+    def update_from_file(self, file_path: str):
+        # predictions dropped by the filters of the evaluated predictions are never added
+        pred = PredJson(file_path, **self._pred.get_options())
+        for image_id, preds in pred.get_annotations().items():
+            self.add_predictions(image_id, preds)
+
+    def _get_image_summaries(self):
+        # row: image, col: get_summary(), updated in place by add_predictions
+        if self._image_summaries is None:
+            self._image_summaries = np.array(
+                [image.get_summary() for image in self.iter_images()], dtype=np.float64
+            ).reshape(-1, SUMMARY_COUNT_SIZE + CORRECT_DISTANCE_SIZE)
+        return self._image_summaries
+
+    def _get_summary_total(self):
+        # sum of the image summaries, updated in place by add_predictions
+        if self._summary_total is None:
+            # summed in image order like the per image loops
+            self._summary_total = np.cumsum(self._get_image_summaries(), axis=0)[-1].copy()
+        return self._summary_total
+
+    def get_error_count_matrix(self, category_ids: list):
+        """
+        row: category_ids, col: Const.MAIN_ERRORS.
+        errors are counted by pred category and miss errors by gt category.
+        errors of categories not in category_ids are counted in the last row.
+        """
+        if self._error_count_matrix is None or self._error_count_category_ids != category_ids:
+            category_indices = {
+                category_id: index for index, category_id in enumerate(category_ids)
+            }
+            table = self._get_label_table()
+            attributed_category_ids = np.where(
+                table.get_error_mask(Const.ERROR_TYPE_MISS),
+                table.get_column("match_gt_category_id"),
+                table.get_column("pred_category_id"),
+            )
+            error_types = table.get_column("error_type")
+            is_error = error_types >= 0
+            rows = np.array(
+                [category_indices.get(category_id, -1) for category_id in attributed_category_ids],
+                dtype=np.int64,
+            )
+            count_matrix = np.zeros((len(category_ids), len(Const.MAIN_ERRORS)), dtype=np.int32)
+            np.add.at(count_matrix, (rows[is_error], error_types[is_error]), 1)
+            self._error_count_matrix = count_matrix
+            self._error_count_category_ids = list(category_ids)
+        return self._error_count_matrix.copy()
+
+    def get_confusion_matrix(self, category_ids: list):
+        """
+        row: pred category_ids, col: gt category_ids of class errors.
+        errors of categories not in category_ids are counted in the last row or column.
+        """
+        category_indices = {category_id: index for index, category_id in enumerate(category_ids)}
+        table = self._get_label_table()
+        is_class_error = table.get_error_mask(Const.ERROR_TYPE_CLASS)
+        rows = np.array(
+            [
+                category_indices.get(category_id, -1)
+                for category_id in table.get_column("pred_category_id")[is_class_error]
+            ],
+            dtype=np.int64,
+        )
+        columns = np.array(
+            [
+                category_indices.get(category_id, -1)
+                for category_id in table.get_column("unmatch_gt_category_id")[is_class_error]
+            ],
+            dtype=np.int64,
+        )
+        confusion_matrix = np.zeros((len(category_ids), len(category_ids)), dtype=np.int32)
+        np.add.at(confusion_matrix, (rows, columns), 1)
+        return confusion_matrix
+
+    def _get_label_table(self):
+        if self._label_table is None:
+            self._label_table = self.get_label_table()
+        return self._label_table
+
+    def _get_error_index(self):
+        # error type -> (image positions, rows in the image, pred category ids) in one pass
+        if self._error_index is None:
+            table = self._get_label_table()
+            label_counts = [len(image.get_label_table()) for image in self.iter_images()]
+            image_positions = np.repeat(np.arange(len(self._images)), label_counts)
+            rows = np.arange(len(table)) - np.repeat(
+                np.cumsum(label_counts) - label_counts, label_counts
+            )
+            pred_category_ids = table.get_column("pred_category_id")
+            self._error_index = {}
+            for error_type in Const.MAIN_ERRORS:
+                mask = table.get_error_mask(error_type)
+                self._error_index[error_type] = (
+                    image_positions[mask],
+                    rows[mask],
+                    pred_category_ids[mask],
+                )
+        return self._error_index
 
     def get_class_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_class_errors():
-                error_labels.extend(image.get_class_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_CLASS)
 
     def get_location_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_location_errors():
-                error_labels.extend(image.get_location_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_LOCATION)
 
     def get_miss_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_miss_errors():
-                error_labels.extend(image.get_miss_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_MISS)
 
     def get_background_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_background_errors():
-                error_labels.extend(image.get_background_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_BACKGROUND)
 
     def get_duplicate_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_duplicate_errors():
-                error_labels.extend(image.get_duplicate_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_DUPLICATE)
 
     def get_both_errors(self):
-        error_labels = []
-        for image in self._images:
-            if image.get_both_errors():
-                error_labels.extend(image.get_both_errors())
-        return error_labels
+        return self.get_errors(Const.ERROR_TYPE_BOTH)
 
     def get_class_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_class_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_CLASS, category_id)
 
     def get_location_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_location_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_LOCATION, category_id)
 
     def get_miss_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_miss_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_MISS, category_id)
 
     def get_background_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_background_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_BACKGROUND, category_id)
 
     def get_duplicate_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_duplicate_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_DUPLICATE, category_id)
 
     def get_both_errors_by_category_id(self, category_id: int):
-        error_labels = []
-        for image in self._images:
-            for label in image.get_both_errors():
-                if label.get_pred_category_id() == category_id:
-                    error_labels.append(label)
-        return error_labels
+        return self.get_errors_by_category_id(Const.ERROR_TYPE_BOTH, category_id)
+
+
+def _merge_categories(gt_categories: dict, pred_categories: dict):
+    # a new dict, the gt is shared by the evaluations of several prediction files
+    categories = dict(gt_categories)
+    for category_id, category_name in pred_categories.items():
+        categories.setdefault(category_id, category_name)
+    if len(categories) == len(gt_categories):
+        return gt_categories
+    return dict(sorted(categories.items()))
+
+
+def _empty_summary():
+    return [0] * SUMMARY_COUNT_SIZE + [0.0] * CORRECT_DISTANCE_SIZE
+
+
+# gt of iter_by_preds, set once per worker process instead of sent with every file
+_shared_gt = None
+
+
+def _set_shared_gt(gt: GtJson):
+    global _shared_gt
+    _shared_gt = gt
+
+
+def _evaluate_pred_file(
+    pred_path: str,
+    binary_path: str,
+    iou_threshold: float,
+    confidence_threshold: float,
+    sparse_box_count: int,
+    pred_options: dict,
+):
+    pred = PredJson(pred_path, **pred_options)
+    evaluation = Evaluator(_shared_gt, pred, iou_threshold, confidence_threshold, sparse_box_count)
+    # predictions of the other images are never used by the evaluation
+    save_binary_annotations(
+        binary_path,
+        {
+            image_id: pred.get_annotation_by_image_id(image_id)
+            for image_id in evaluation.get_image_ids()
+        },
+        categories=pred.get_categories(),
+    )
+    return [image.get_label_table() for image in evaluation.iter_images()]
+
+
+def _submit(executor: ProcessPoolExecutor, function, *args):
+    # the result itself without executor, a future otherwise
+    if executor is None:
+        return function(*args)
+    return executor.submit(function, *args)
+
+
+def _create_label_tables(
+    image_annotations: list,
+    categories: dict,
+    iou_threshold: float,
+    confidence_threshold: float,
+    sparse_box_count: int,
+):
+    label_tables = []
+    for image, gt_annotation, pred_annotation in image_annotations:
+        image = Image(
+            image,
+            categories,
+            gt_annotation,
+            pred_annotation,
+            iou_threshold,
+            confidence_threshold,
+            sparse_box_count,
+        )
+        label_tables.append(image.get_label_table())
+    return label_tables
@@ -1,6 +1,8 @@
 import csv
 import math
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import cv2
@@ -13,7 +15,18 @@ from tqdm import tqdm
 
 import nobunaga.constants as Const
 from nobunaga.evaluator import Evaluator
-from nobunaga.io import plot_bar, plot_matrix, plot_pie, print_table, write_label
+from nobunaga.io import (
+    ImageCache,
+    ImageWriter,
+    draw_label,
+    iter_decoded_images,
+    plot_bar,
+    plot_matrix,
+    plot_pie,
+    print_table,
+    write_label,
+    write_label_table,
+)
 
 
 class ImagePrinter(object):
@@ -37,23 +50,13 @@ class ImagePrinter(object):
         self._out_dir.mkdir(exist_ok=True)
         self._occ_out_dir = Path(f"./_{self._model_name}_occ")
         self._occ_out_dir.mkdir(exist_ok=True)
+        # images are decoded once for all panels, labels and error types
+        self._image_cache = ImageCache()
 
     def output_confusion_matrix(self, normalize: bool):
         confusion_matrix = {}
-        class_count = len(self._categories)
         # row: predicted classes, col: actual classes
-        cm = np.zeros((class_count, class_count), dtype=np.int32)
-        for class_error in self._class_error_labels:
-            try:
-                gt_category_id = self._index_category_id_relations.get(
-                    class_error.get_max_unmatch_gt_category_id(), -1
-                )
-                pred_category_id = self._index_category_id_relations.get(
-                    class_error.get_pred_category_id(), -1
-                )
-                cm[pred_category_id][gt_category_id] += 1
-            except:
-                pass
+        cm = self._evaluation.get_confusion_matrix(list(self._categories.keys()))
 
         # output to terminal
         confusion_matrix[self._model_name] = cm
@@ -83,46 +86,8 @@ class ImagePrinter(object):
 
     def output_error_type_detail(self, normalize: bool, mode: list = ["confusion_matrix", "strip"]):
         confusion_matrix = {}
-        class_count = len(self._categories)
-        error_type_count = len(Const.MAIN_ERRORS)
         # row: ground truth classes, col: error_type
-        cm = np.zeros((class_count, error_type_count), dtype=np.int32)
-        for error_label in self._class_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_pred_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
-        for error_label in self._location_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_pred_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
-        for error_label in self._duplicate_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_pred_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
-        for error_label in self._background_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_pred_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
-        for error_label in self._miss_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_max_match_gt_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
-        for error_label in self._both_error_labels:
-            category_id = self._index_category_id_relations.get(
-                error_label.get_pred_category_id(), -1
-            )
-            error_type_id = Const.MAIN_ERRORS.index(error_label.get_error_type())
-            cm[category_id][error_type_id] += 1
+        cm = self._evaluation.get_error_count_matrix(list(self._categories.keys()))
 
         # output to terminal
         confusion_matrix[self._model_name] = cm
@@ -192,6 +157,30 @@ class ImagePrinter(object):
             plt.savefig(str(self._out_dir / f"{self._model_name}_error_type_strip.png"))
 
     def output_correction_distance_csv_per_label(self):
+        correction_distances = self._get_correction_distances_per_label()
+
+        # output csv
+        with open(
+            str(self._occ_out_dir / f"{self._model_name}_correction_distance_per_label.csv"), mode="w"
+        ) as f:
+            csv_writer = csv.writer(f)
+            for correction_distance in correction_distances:
+                csv_writer.writerow(correction_distance)
+
+    def output_correction_distance_parquet_per_label(self):
+        correction_distances = self._get_correction_distances_per_label()
+        pd.DataFrame(correction_distances[1:], columns=correction_distances[0]).to_parquet(
+            str(self._occ_out_dir / f"{self._model_name}_correction_distance_per_label.parquet"),
+            index=False,
+        )
+
+    def output_label_table_parquet(self):
+        write_label_table(
+            self._evaluation.get_label_table(),
+            str(self._out_dir / f"{self._model_name}_label_table.parquet"),
+        )
+
+    def _get_correction_distances_per_label(self):
         COST_POSTFIX = " Cost"
         correction_distances = [
             [
@@ -221,14 +210,7 @@ class ImagePrinter(object):
                 label_names = [pred_label_name, gt_label_name]
                 correction_distance = label.get_correct_distance()
                 correction_distances.append([image_name] + label_names + correction_distance)
-
-        # output csv
-        with open(
-            str(self._occ_out_dir / f"{self._model_name}_correction_distance_per_label.csv"), mode="w"
-        ) as f:
-            csv_writer = csv.writer(f)
-            for correction_distance in correction_distances:
-                csv_writer.writerow(correction_distance)
+        return correction_distances
 
     def output_correction_distance_csv_per_file(self):
         COST_POSTFIX = " Cost"
@@ -299,11 +281,108 @@ class ImagePrinter(object):
             output_dir.mkdir(exist_ok=True, parents=True)
 
             new_file_path = str(output_dir / image.get_image_name())
-            write_label(str(self._image_dir / image.get_image_name()), new_file_path, bboxes, 2)
+            write_label(
+                str(self._image_dir / image.get_image_name()),
+                new_file_path,
+                bboxes,
+                2,
+                self._image_cache,
+            )
 
 
-    def output_error_files(self, error_type: str):
-        # get all error labels
+    def output_error_files(self, error_type: str, max_side: int = None):
+        error_labels = self._get_error_labels(error_type)
+        index_dict = {}
+        for error_label in tqdm(error_labels, error_type + " error"):
+            image = self._evaluation.get_image_by_image_id(error_label.get_image_id())
+            all_pred_bboxes, all_gt_bboxes = self._get_all_bboxes(image)
+            image_name = error_label.get_image_name()
+            _, output_dir, bboxes = self._get_error_file(
+                error_type, error_label, all_pred_bboxes, all_gt_bboxes
+            )
+            new_file_path = _get_error_file_path(
+                output_dir, image_name, index_dict.get(image_name, 1)
+            )
+            try:
+                write_label(
+                    str(self._image_dir / image_name),
+                    new_file_path,
+                    bboxes,
+                    2,
+                    self._image_cache,
+                    max_side,
+                )
+            except:
+                continue
+            index_dict[image_name] = index_dict.get(image_name, 1) + 1
+
+    def output_all_error_files(
+        self,
+        workers: int = 1,
+        decode_queue_size: int = Const.RENDER_DECODE_QUEUE_SIZE,
+        write_queue_size: int = Const.RENDER_WRITE_QUEUE_SIZE,
+        max_side: int = None,
+    ):
+        """
+        same files as output_error_files of every error type, written image by image.
+        all pred and all gt boxes are created once per image.
+        with workers > 1 images are written in worker processes, which get only the boxes.
+        source images are decoded ahead and drawn images are written behind drawing,
+        at most decode_queue_size and write_queue_size images are waiting in each process.
+        with max_side, images are decoded and drawn with the longer side at most max_side.
+        """
+        # labels of the same image name, in the order of output_error_files to keep the numbering
+        image_error_labels = OrderedDict()
+        for error_type in Const.MAIN_ERRORS:
+            for error_label in self._get_error_labels(error_type):
+                image_error_labels.setdefault(error_label.get_image_name(), []).append(
+                    (error_type, error_label)
+                )
+
+        image_paths = []
+        image_error_files = []
+        for image_name, error_labels in image_error_labels.items():
+            all_bboxes = {}
+            error_files = []
+            for error_type, error_label in error_labels:
+                image_id = error_label.get_image_id()
+                if image_id not in all_bboxes:
+                    image = self._evaluation.get_image_by_image_id(image_id)
+                    all_bboxes[image_id] = self._get_all_bboxes(image)
+                all_pred_bboxes, all_gt_bboxes = all_bboxes[image_id]
+                error_files.append(
+                    self._get_error_file(error_type, error_label, all_pred_bboxes, all_gt_bboxes)
+                )
+            image_paths.append(str(self._image_dir / image_name))
+            image_error_files.append(error_files)
+        image_names = list(image_error_labels.keys())
+
+        write_error_files = partial(
+            _write_error_files,
+            decode_queue_size=decode_queue_size,
+            write_queue_size=write_queue_size,
+            max_side=max_side,
+        )
+        chunks = [
+            (
+                image_paths[start : start + Const.RENDER_CHUNK_SIZE],
+                image_names[start : start + Const.RENDER_CHUNK_SIZE],
+                image_error_files[start : start + Const.RENDER_CHUNK_SIZE],
+            )
+            for start in range(0, len(image_names), Const.RENDER_CHUNK_SIZE)
+        ]
+        with tqdm(total=len(image_names), desc="error images") as progress:
+            if workers <= 1:
+                for chunk in chunks:
+                    progress.update(write_error_files(*chunk))
+                return
+
+            # the numbering is per image, so each image is numbered in one worker the same way
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for image_count in executor.map(write_error_files, *zip(*chunks)):
+                    progress.update(image_count)
+
+    def _get_error_labels(self, error_type: str):
         error_labels = []
         if error_type == Const.ERROR_TYPE_CLASS:
             error_labels = self._class_error_labels
@@ -317,117 +396,109 @@ class ImagePrinter(object):
             error_labels = self._duplicate_error_labels
         elif error_type == Const.ERROR_TYPE_BOTH:
             error_labels = self._both_error_labels
-
-        index_dict = {}
-        for error_label in tqdm(error_labels, error_type + " error"):
-            # get pred, gt label per error.
-            pred_label = error_label.get_pred_label()
-            if error_type == Const.ERROR_TYPE_MISS:
-                pred_label = None
-            gt_label = error_label.get_gt_match_label()
-            if error_type == Const.ERROR_TYPE_CLASS or error_type == Const.ERROR_TYPE_BOTH:
-                gt_label = error_label.get_gt_unmatch_label()
-            elif error_type == Const.ERROR_TYPE_BACKGROUND:
-                gt_label = None
-            elif error_type == Const.ERROR_TYPE_DUPLICATE:
-                pred_labels = error_label.get_duplicate_pred_labels()
-                pred_labels.append(error_label.get_pred_label())
-                pred_label = pred_labels
-            image_name = error_label.get_image_name()
-
-            # get pred bboxes of error label.
-            pred_bboxes = []
-            if type(pred_label) == list:
-                for pred in pred_label:
-                    pred_category_name = self._categories.get(pred.get_category_id())
-                    pred_bbox = pred.get_bbox()
-                    pred_confidence = float("{:.2f}".format(pred.get_confidence() * 100))
-                    pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
-            elif not pred_label:
-                pred_category_name = ""
-                pred_bbox = [0, 0, 0, 0]
-                pred_confidence = 0
-                pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
-            else:
-                pred_category_name = self._categories.get(pred_label.get_category_id())
-                pred_bbox = pred_label.get_bbox()
-                pred_confidence = float("{:.2f}".format(pred_label.get_confidence() * 100))
-                pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
-
-            # get gt bboxes of error label.
-            gt_bboxes = []
-            if not gt_label:
-                gt_category_name = ""
-                gt_bbox = [0, 0, 0, 0]
-                gt_confidence = 0
-            else:
-                gt_category_name = self._categories.get(gt_label.get_category_id())
-                gt_bbox = gt_label.get_bbox()
+        return error_labels
+
+    def _get_all_bboxes(self, image):
+        # get all detection and gt of this image.
+        all_pred_bboxes = []
+        all_gt_bboxes = []
+        for all_label in image.get_labels():
+            # pred label
+            all_pred_label = all_label.get_pred_label()
+            if (
+                all_pred_label is not None
+                and all_pred_label.get_confidence() > self._evaluation.get_confidence_threshold()
+            ):
+                pred_category_name = self._categories.get(all_pred_label.get_category_id())
+                pred_bbox = all_pred_label.get_bbox()
+                pred_confidence = float("{:.2f}".format(all_pred_label.get_confidence() * 100))
+                all_pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
+
+            # gt label
+            all_gt_label = all_label.get_gt_match_label()
+            if all_gt_label is not None:
+                gt_category_name = self._categories.get(all_gt_label.get_category_id())
+                gt_bbox = all_gt_label.get_bbox()
                 gt_confidence = ""
-            gt_bboxes.append([gt_category_name] + gt_bbox + [gt_confidence])
-            image_name_path = Path(image_name)
-
-            # get all detection and gt of this image.
-            image = self._evaluation.get_image_by_image_id(error_label.get_image_id())
-            all_pred_bboxes = []
-            all_gt_bboxes = []
-            for all_label in image.get_labels():
-                # pred label
-                all_pred_label = all_label.get_pred_label()
-                if (
-                    all_pred_label is not None
-                    and all_pred_label.get_confidence()
-                    > self._evaluation.get_confidence_threshold()
-                ):
-                    pred_category_name = self._categories.get(all_pred_label.get_category_id())
-                    pred_bbox = all_pred_label.get_bbox()
-                    pred_confidence = float("{:.2f}".format(all_pred_label.get_confidence() * 100))
-                    all_pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
-
-                # gt label
-                all_gt_label = all_label.get_gt_match_label()
-                if all_gt_label is not None:
-                    gt_category_name = self._categories.get(all_gt_label.get_category_id())
-                    gt_bbox = all_gt_label.get_bbox()
-                    gt_confidence = ""
-                    all_gt_bboxes.append([gt_category_name] + gt_bbox + [gt_confidence])
-
-            bboxes = {
-                "pred": pred_bboxes,
-                "gt": gt_bboxes,
-                "all pred": all_pred_bboxes,
-                "all gt": all_gt_bboxes,
-            }
-
-            # create output directory
-            error_type = error_label.get_error_type()
-            if error_type in [Const.ERROR_TYPE_CLASS, Const.ERROR_TYPE_BOTH]:
-                category_name = self._categories.get(
-                    error_label.get_gt_unmatch_label().get_category_id()
-                )
-            elif error_type in [
-                Const.ERROR_TYPE_LOCATION,
-                Const.ERROR_TYPE_MISS,
-                Const.ERROR_TYPE_DUPLICATE,
-            ]:
-                category_name = self._categories.get(
-                    error_label.get_gt_match_label().get_category_id()
-                )
-            else:
-                category_name = self._categories.get(error_label.get_pred_category_id())
-
-            output_dir = Path(f"./_{self._model_name}_error/{error_type}/{category_name}")
-            output_dir.mkdir(exist_ok=True, parents=True)
-
-            new_file_path = str(
-                output_dir
-                / f"{image_name_path.stem}_{str(index_dict.get(image_name, 1))}{image_name_path.suffix}"
+                all_gt_bboxes.append([gt_category_name] + gt_bbox + [gt_confidence])
+        return all_pred_bboxes, all_gt_bboxes
+
+    def _get_error_file(
+        self, error_type: str, error_label, all_pred_bboxes: list, all_gt_bboxes: list
+    ):
+        """
+        (error type, output directory, bboxes of each panel) of the error label.
+        """
+        # get pred, gt label per error.
+        pred_label = error_label.get_pred_label()
+        if error_type == Const.ERROR_TYPE_MISS:
+            pred_label = None
+        gt_label = error_label.get_gt_match_label()
+        if error_type == Const.ERROR_TYPE_CLASS or error_type == Const.ERROR_TYPE_BOTH:
+            gt_label = error_label.get_gt_unmatch_label()
+        elif error_type == Const.ERROR_TYPE_BACKGROUND:
+            gt_label = None
+        elif error_type == Const.ERROR_TYPE_DUPLICATE:
+            pred_labels = list(error_label.get_duplicate_pred_labels())
+            pred_labels.append(error_label.get_pred_label())
+            pred_label = pred_labels
+
+        # get pred bboxes of error label.
+        pred_bboxes = []
+        if type(pred_label) == list:
+            for pred in pred_label:
+                pred_category_name = self._categories.get(pred.get_category_id())
+                pred_bbox = pred.get_bbox()
+                pred_confidence = float("{:.2f}".format(pred.get_confidence() * 100))
+                pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
+        elif not pred_label:
+            pred_category_name = ""
+            pred_bbox = [0, 0, 0, 0]
+            pred_confidence = 0
+            pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
+        else:
+            pred_category_name = self._categories.get(pred_label.get_category_id())
+            pred_bbox = pred_label.get_bbox()
+            pred_confidence = float("{:.2f}".format(pred_label.get_confidence() * 100))
+            pred_bboxes.append([pred_category_name] + pred_bbox + [pred_confidence])
+
+        # get gt bboxes of error label.
+        gt_bboxes = []
+        if not gt_label:
+            gt_category_name = ""
+            gt_bbox = [0, 0, 0, 0]
+            gt_confidence = 0
+        else:
+            gt_category_name = self._categories.get(gt_label.get_category_id())
+            gt_bbox = gt_label.get_bbox()
+            gt_confidence = ""
+        gt_bboxes.append([gt_category_name] + gt_bbox + [gt_confidence])
+
+        bboxes = {
+            "pred": pred_bboxes,
+            "gt": gt_bboxes,
+            "all pred": all_pred_bboxes,
+            "all gt": all_gt_bboxes,
+        }
+
+        # create output directory
+        label_error_type = error_label.get_error_type()
+        if label_error_type in [Const.ERROR_TYPE_CLASS, Const.ERROR_TYPE_BOTH]:
+            category_name = self._categories.get(
+                error_label.get_gt_unmatch_label().get_category_id()
             )
-            try:
-                write_label(str(self._image_dir / image_name), new_file_path, bboxes, 2)
-            except:
-                continue
-            index_dict[image_name] = index_dict.get(image_name, 1) + 1
+        elif label_error_type in [
+            Const.ERROR_TYPE_LOCATION,
+            Const.ERROR_TYPE_MISS,
+            Const.ERROR_TYPE_DUPLICATE,
+        ]:
+            category_name = self._categories.get(error_label.get_gt_match_label().get_category_id())
+        else:
+            category_name = self._categories.get(error_label.get_pred_category_id())
+
+        output_dir = Path(f"./_{self._model_name}_error/{label_error_type}/{category_name}")
+        output_dir.mkdir(exist_ok=True, parents=True)
+        return error_type, str(output_dir), bboxes
 
     def output_error_summary(self):
         mpl.rcParams["figure.dpi"] = 150
@@ -576,3 +647,74 @@ class ImagePrinter(object):
                 str(self._out_dir / "{}_{}_summary.png".format(self._model_name, Const.MODE_BBOX)),
                 summary_im,
             )
+
+
+def output_threshold_summary(model_name: str, summaries: dict, threshold_name: str):
+    """
+    error distribution and OCC by threshold, or by model.
+    summaries are threshold -> Evaluator.get_summary().
+    """
+    COST_POSTFIX = " Cost"
+    error_count = len(Const.MAIN_ERRORS) + len(Const.SPECIAL_ERRORS)
+    error_rows = [[threshold_name] + Const.MAIN_ERRORS + Const.SPECIAL_ERRORS]
+    summary_rows = [
+        [threshold_name]
+        + Const.MAIN_ERRORS
+        + Const.SPECIAL_ERRORS
+        + [Const.ERROR_TRUE_POSITIVE]
+        + [error_type + COST_POSTFIX for error_type in Const.MAIN_ERRORS]
+        + ["Total No Error" + COST_POSTFIX, "Total Error" + COST_POSTFIX]
+    ]
+    for threshold, summary in summaries.items():
+        error_rows.append([str(threshold)] + [str(count) for count in summary[:error_count]])
+        summary_rows.append([threshold] + summary)
+
+    # output to terminal
+    print_table(error_rows, title=f"{model_name} error distribution by {threshold_name}")
+
+    # output csv
+    out_dir = Path(f"./_{model_name}_result")
+    out_dir.mkdir(exist_ok=True)
+    with open(str(out_dir / f"{model_name}_{threshold_name}_summary.csv"), mode="w") as f:
+        csv_writer = csv.writer(f)
+        for summary_row in summary_rows:
+            csv_writer.writerow(summary_row)
+
+
+def _get_error_file_path(output_dir: str, image_name: str, index: int):
+    image_name_path = Path(image_name)
+    return str(Path(output_dir) / f"{image_name_path.stem}_{str(index)}{image_name_path.suffix}")
+
+
+def _write_error_files(
+    image_paths: list,
+    image_names: list,
+    image_error_files: list,
+    decode_queue_size: int,
+    write_queue_size: int,
+    max_side: int,
+):
+    """
+    write the error files of each image in order, numbered per error type of the image.
+    the number is skipped only when drawing fails, as in output_error_files.
+    """
+    decoded_images = iter_decoded_images(
+        image_paths, queue_size=decode_queue_size, max_side=max_side
+    )
+    with ImageWriter(queue_size=write_queue_size) as image_writer:
+        for (image, scale), image_name, error_files in zip(
+            decoded_images, image_names, image_error_files
+        ):
+            index_dict = {}
+            for error_type, output_dir, bboxes in error_files:
+                index = index_dict.get(error_type, 1)
+                try:
+                    merged_image = draw_label(image, bboxes, 2, scale)
+                except:
+                    continue
+                if merged_image is not None:
+                    image_writer.write(
+                        merged_image, _get_error_file_path(output_dir, image_name, index)
+                    )
+                index_dict[error_type] = index + 1
+    return len(image_names)
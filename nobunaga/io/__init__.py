@@ -1,5 +1,7 @@
 from .gt_json import GtJson
+from .json_lines import iter_json_lines_groups
 from .output_terminal import print_table
+from .parquet import write_label_table
 from .plot_util import plot_bar, plot_matrix, plot_pie
 from .pred_json import PredJson
-from .visualizer import write_label
+from .visualizer import ImageCache, ImageWriter, draw_label, iter_decoded_images, write_label
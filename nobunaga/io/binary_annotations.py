@@ -0,0 +1,155 @@
+import json
+import math
+from collections.abc import MutableMapping
+
+import numpy as np
+
+import nobunaga.constants as Const
+from nobunaga.utils import create_id_array, to_saved_id_array
+
+MAGIC = b"NOBUNAGA"
+ALIGNMENT = 64
+
+
+def is_binary_annotation_file(file_path: str):
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_binary_annotations(
+    file_path: str, annotations: dict, images: dict = None, categories: dict = None
+):
+    """
+    annotations as columns: bboxes, category ids and scores of all annotations in image order,
+    and the offset of the first annotation of each image. image ids, and images and categories
+    of gt are kept in the header.
+    """
+    image_ids = list(annotations.keys())
+    counts = [len(annotations[image_id]) for image_id in image_ids]
+    rows = [annotation for image_id in image_ids for annotation in annotations[image_id]]
+    columns = {
+        "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        "bboxes": np.array([row[Const.MODE_BBOX] for row in rows], dtype=np.float64).reshape(-1, 4),
+        "category_ids": to_saved_id_array(
+            create_id_array([row.get("category_id", -1) for row in rows])
+        ),
+        # nan when the annotation has no score, e.g. gt
+        "scores": np.array([row.get("score", np.nan) for row in rows], dtype=np.float64),
+    }
+
+    header = {
+        "image_ids": image_ids,
+        "images": list((images or {}).values()),
+        "categories": [[category_id, name] for category_id, name in (categories or {}).items()],
+        "columns": {},
+    }
+    offset = 0
+    for name, column in columns.items():
+        header["columns"][name] = {
+            "dtype": column.dtype.str,
+            "shape": list(column.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + column.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_offset = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    with open(file_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, column in columns.items():
+            f.seek(data_offset + header["columns"][name]["offset"])
+            f.write(np.ascontiguousarray(column).tobytes())
+
+
+class BinaryAnnotations(MutableMapping):
+    """
+    image id -> annotation dicts, created on access from columns mapped with np.memmap.
+    the pages are shared by every process opening the same file.
+    annotations set afterwards are kept in memory.
+    """
+
+    def __init__(self, file_path: str):
+        with open(file_path, "rb") as f:
+            f.read(len(MAGIC))
+            header_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_size).decode())
+        data_offset = _align(len(MAGIC) + 8 + header_size)
+
+        self._columns = {}
+        for name, column in header["columns"].items():
+            if np.prod(column["shape"]) == 0:
+                self._columns[name] = np.zeros(column["shape"], dtype=column["dtype"])
+                continue
+            self._columns[name] = np.memmap(
+                file_path,
+                dtype=np.dtype(column["dtype"]),
+                mode="r",
+                offset=data_offset + column["offset"],
+                shape=tuple(column["shape"]),
+            )
+        self._images = {image.get("id", -1): image for image in header["images"]}
+        self._categories = {category_id: name for category_id, name in header["categories"]}
+        self._image_positions = {
+            image_id: position for position, image_id in enumerate(header["image_ids"])
+        }
+        self._overrides = {}
+
+    def get_images(self):
+        return self._images
+
+    def get_categories(self):
+        return self._categories
+
+    def has_arrays(self, image_id: int):
+        return image_id in self._image_positions and image_id not in self._overrides
+
+    def get_arrays(self, image_id: int):
+        """
+        (bboxes, category ids) of the image, views of the mapped columns.
+        """
+        start, end = self._get_range(image_id)
+        return self._columns["bboxes"][start:end], self._columns["category_ids"][start:end]
+
+    def __getitem__(self, image_id: int):
+        if image_id in self._overrides:
+            return self._overrides[image_id]
+        if image_id not in self._image_positions:
+            raise KeyError(image_id)
+        start, end = self._get_range(image_id)
+        bboxes = self._columns["bboxes"][start:end].tolist()
+        category_ids = self._columns["category_ids"][start:end].tolist()
+        scores = self._columns["scores"][start:end].tolist()
+        annotations = []
+        for bbox, category_id, score in zip(bboxes, category_ids, scores):
+            annotation = {"image_id": image_id, "category_id": category_id, Const.MODE_BBOX: bbox}
+            if not math.isnan(score):
+                annotation["score"] = score
+            annotations.append(annotation)
+        return annotations
+
+    def __setitem__(self, image_id: int, annotations: list):
+        self._overrides[image_id] = annotations
+
+    def __delitem__(self, image_id: int):
+        raise TypeError("annotations of a binary file can not be deleted.")
+
+    def __iter__(self):
+        yield from self._image_positions.keys()
+        for image_id in self._overrides.keys():
+            if image_id not in self._image_positions:
+                yield image_id
+
+    def __len__(self):
+        return len(self._image_positions) + len(
+            [image_id for image_id in self._overrides if image_id not in self._image_positions]
+        )
+
+    def _get_range(self, image_id: int):
+        position = self._image_positions[image_id]
+        return int(self._columns["offsets"][position]), int(self._columns["offsets"][position + 1])
+
+
+def _align(offset: int):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -1,13 +1,42 @@
 import json
 
+import numpy as np
+
+import nobunaga.constants as Const
+
+from .binary_annotations import (
+    BinaryAnnotations,
+    is_binary_annotation_file,
+    save_binary_annotations,
+)
+from .parquet import is_table_file, iter_table_annotations
+
+# columns read from a gt table, file_name and category_name make images and categories
+GT_TABLE_COLUMNS = ["image_id", "category_id", Const.MODE_BBOX, "file_name", "category_name"]
+
 
 class GtJson(object):
     def __init__(self, file_path: str):
-        with open(file_path, "r") as json_file:
-            cocojson = json.load(json_file)
         self._images = {}
         self._annotations = {}
         self._categories = {}
+        # per image bbox and category arrays, shared by every evaluation of this gt
+        self._image_arrays = {}
+
+        # columns saved by save_binary, mapped instead of parsed
+        if is_binary_annotation_file(file_path):
+            self._annotations = BinaryAnnotations(file_path)
+            self._images = self._annotations.get_images()
+            self._categories = self._annotations.get_categories()
+            return
+
+        # parquet or arrow table, one annotation per row
+        if is_table_file(file_path):
+            self._read_table(file_path)
+            return
+
+        with open(file_path, "r") as json_file:
+            cocojson = json.load(json_file)
 
         for image in cocojson.get("images", []):
             self._images[image.get("id", -1)] = image
@@ -27,6 +56,19 @@ class GtJson(object):
         for category in cocojson["categories"] if "categories" in cocojson else []:
             self._categories[category.get("id", -1)] = category.get("name", "")
 
+    def _read_table(self, file_path: str):
+        categories = {}
+        for annotation in iter_table_annotations(file_path, GT_TABLE_COLUMNS):
+            image_id = annotation.get("image_id")
+            file_name = annotation.pop("file_name", None)
+            if file_name is not None and image_id not in self._images:
+                self._images[image_id] = {"id": image_id, "file_name": file_name}
+            category_name = annotation.pop("category_name", None)
+            if category_name is not None:
+                categories[annotation.get("category_id", -1)] = category_name
+            self._annotations.setdefault(image_id, []).append(annotation)
+        self._categories = dict(sorted(categories.items()))
+
     def get_image_dict(self):
         image_dict = {}
         for image_id, image in self._images.items():
@@ -52,6 +94,22 @@ class GtJson(object):
     def get_annotation_by_image_id(self, image_id: int):
         return self._annotations.get(image_id, [])
 
+    def get_image_arrays(self, image_id: int):
+        """
+        (bboxes, category ids) of the annotations of the image as numpy arrays.
+        """
+        if isinstance(self._annotations, BinaryAnnotations) and self._annotations.has_arrays(
+            image_id
+        ):
+            return self._annotations.get_arrays(image_id)
+        if image_id not in self._image_arrays:
+            annotations = self.get_annotation_by_image_id(image_id)
+            self._image_arrays[image_id] = create_gt_arrays(annotations)
+        return self._image_arrays[image_id]
+
+    def save_binary(self, file_path: str):
+        save_binary_annotations(file_path, self._annotations, self._images, self._categories)
+
     def get_category_by_image_id(self, image_id: int):
         return self._categories.get(image_id, {})
 
@@ -60,3 +118,11 @@ class GtJson(object):
 
     def get_category_name(self, category_id: int):
         return self._categories.get(category_id, "").get("name", "")
+
+
+def create_gt_arrays(annotations: list):
+    bboxes = np.asarray(
+        [annotation[Const.MODE_BBOX] for annotation in annotations], dtype=np.float64
+    ).reshape(-1, 4)
+    category_ids = np.array([annotation.get("category_id", "") for annotation in annotations])
+    return bboxes, category_ids
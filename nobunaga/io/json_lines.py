@@ -0,0 +1,42 @@
+import json
+
+
+def iter_json_lines_annotations(file_path: str):
+    """
+    yield predictions of a json lines file, one prediction or one image per line.
+    """
+    for _, annotations in iter_json_lines_groups(file_path):
+        yield from annotations
+
+
+def iter_json_lines_groups(file_path: str):
+    """
+    yield (image_id, predictions) of each run of lines of the same image.
+    an image appears once when the file is grouped by image_id.
+    """
+    image_id = None
+    annotations = []
+    with open(file_path, "r") as json_file:
+        for line in json_file:
+            if line.strip() == "":
+                continue
+            record_image_id, record_annotations = _get_record_annotations(json.loads(line))
+            if record_image_id != image_id and len(annotations) > 0:
+                yield image_id, annotations
+                annotations = []
+            image_id = record_image_id
+            annotations.extend(record_annotations)
+    if len(annotations) > 0:
+        yield image_id, annotations
+
+
+def _get_record_annotations(record: dict):
+    image_id = record.get("image_id")
+    # one image per line, like the panoptic layout
+    for key in ["annotations", "segments_info"]:
+        if key in record:
+            annotations = record[key]
+            for annotation in annotations:
+                annotation["image_id"] = image_id
+            return image_id, annotations
+    return image_id, [record]
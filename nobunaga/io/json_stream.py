@@ -0,0 +1,106 @@
+import json
+
+READ_CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+# characters which can follow a complete value
+VALUE_ENDS = WHITESPACE + ",:]}"
+
+
+class JsonStream(object):
+    """
+    reads a json file value by value, only the value being decoded is kept in memory.
+    """
+
+    def __init__(self, json_file):
+        self._json_file = json_file
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._is_eof = False
+
+    def iter_array(self):
+        """
+        yield each element of the array at the current position.
+        """
+        self._expect("[")
+        if self.peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield self.decode()
+            separator = self.peek()
+            self._position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or ']' but got {separator!r}.")
+
+    def iter_object(self):
+        """
+        yield each key of the object at the current position.
+        the value of the key has to be read by decode(), iter_array() or skip() before the next key.
+        """
+        self._expect("{")
+        if self.peek() == "}":
+            self._position += 1
+            return
+        while True:
+            key = self.decode()
+            self._expect(":")
+            yield key
+            separator = self.peek()
+            self._position += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or '}}' but got {separator!r}.")
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+                # a number at the end of the buffer may continue in the next chunk,
+                # e.g. "2017." or "1e" is decoded as 2017 or 1 before the rest is read
+                if self._is_eof or (end < len(self._buffer) and self._buffer[end] in VALUE_ENDS):
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                if self._is_eof:
+                    raise
+            self._read()
+
+    def skip(self):
+        # arrays are skipped element by element, large values are never held at once
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                pass
+        elif self.peek() == "{":
+            for _ in self.iter_object():
+                self.skip()
+        else:
+            self.decode()
+
+    def peek(self):
+        while True:
+            buffer_size = len(self._buffer)
+            while self._position < buffer_size and self._buffer[self._position] in WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if self._is_eof:
+                raise ValueError("unexpected end of json.")
+            self._read()
+
+    def _expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} but got {self.peek()!r}.")
+        self._position += 1
+
+    def _read(self):
+        chunk = self._json_file.read(READ_CHUNK_SIZE)
+        if chunk == "":
+            self._is_eof = True
+        # drop what is already decoded
+        self._buffer = self._buffer[self._position :] + chunk
+        self._position = 0
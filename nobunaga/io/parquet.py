@@ -0,0 +1,112 @@
+from pathlib import Path
+
+import numpy as np
+
+import nobunaga.constants as Const
+from nobunaga.utils import to_saved_id_array
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+PARQUET_SUFFIX = ".parquet"
+
+
+def is_table_file(file_path: str):
+    return Path(file_path).suffix in Const.TABLE_SUFFIXES
+
+
+def iter_table_annotations(file_path: str, columns: list):
+    """
+    yield annotation dicts of a parquet or arrow table batch by batch.
+    only columns which the table has are read, and null values are left out.
+    """
+    for batch in _iter_batches(file_path, columns):
+        # values are converted column by column, rows only gather them
+        names = batch.schema.names
+        values = [_get_column_values(column) for column in batch.columns]
+        valid_rows = [
+            column.is_valid().to_numpy(zero_copy_only=False) if column.null_count > 0 else None
+            for column in batch.columns
+        ]
+        if all(is_valid is None for is_valid in valid_rows):
+            for row_values in zip(*values):
+                yield dict(zip(names, row_values))
+            continue
+        for row, row_values in enumerate(zip(*values)):
+            yield {
+                name: value
+                for name, value, is_valid in zip(names, row_values, valid_rows)
+                if is_valid is None or is_valid[row]
+            }
+
+
+def write_label_table(label_table, file_path: str):
+    """
+    label table columns as parquet, duplicates and correct distances as list columns.
+    """
+    _check_pyarrow()
+    columns = {}
+    for name in label_table.get_column_names():
+        column = label_table.get_column(name)
+        if name == "error_type":
+            error_types = np.array(Const.MAIN_ERRORS + [None], dtype=object)
+            columns[name] = pa.array(error_types[column], type=pa.string())
+        elif name == "correct_distance":
+            columns[name] = pa.FixedSizeListArray.from_arrays(
+                pa.array(np.ascontiguousarray(column).reshape(-1)), column.shape[1]
+            )
+        elif name not in ["duplicate_offsets", "duplicate_pred_index", "duplicate_iou"]:
+            # ids of mixed types, e.g. string category ids and -1, as one string column
+            columns[name] = pa.array(to_saved_id_array(column))
+    offsets = pa.array(label_table.get_column("duplicate_offsets").astype(np.int32))
+    for name in ["duplicate_pred_index", "duplicate_iou"]:
+        columns[name] = pa.ListArray.from_arrays(offsets, pa.array(label_table.get_column(name)))
+    pq.write_table(pa.table(columns), file_path)
+
+
+def _get_column_values(column):
+    # boxes of the same length as one 2d array, numbers through numpy
+    if column.null_count > 0 or pa.types.is_string(column.type):
+        return column.to_pylist()
+    if pa.types.is_fixed_size_list(column.type):
+        size = column.type.list_size
+    elif pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        lengths = pc.list_value_length(column).to_numpy(zero_copy_only=False)
+        if len(lengths) == 0 or np.any(lengths != lengths[0]) or lengths[0] == 0:
+            return column.to_pylist()
+        size = int(lengths[0])
+    elif pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        return column.to_numpy(zero_copy_only=False).tolist()
+    else:
+        return column.to_pylist()
+    flat_values = column.flatten()
+    if flat_values.null_count > 0:
+        return column.to_pylist()
+    return flat_values.to_numpy(zero_copy_only=False).reshape(-1, size).tolist()
+
+
+def _iter_batches(file_path: str, columns: list):
+    _check_pyarrow()
+    if Path(file_path).suffix == PARQUET_SUFFIX:
+        # row groups are read one by one
+        parquet_file = pq.ParquetFile(file_path)
+        names = [name for name in columns if name in parquet_file.schema_arrow.names]
+        yield from parquet_file.iter_batches(columns=names)
+        return
+
+    with pa.memory_map(file_path, "r") as source:
+        reader = pa.ipc.open_file(source)
+        names = [name for name in columns if name in reader.schema.names]
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index).select(names)
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is needed for parquet and arrow files: pip install pyarrow")
@@ -1,11 +1,84 @@
+import heapq
 import json
 
+import nobunaga.constants as Const
+
+from .binary_annotations import (
+    BinaryAnnotations,
+    is_binary_annotation_file,
+    save_binary_annotations,
+)
+from .json_lines import iter_json_lines_annotations
+from .json_stream import JsonStream
+from .parquet import is_table_file, iter_table_annotations
+
+# fields of a prediction used by the evaluation
+PRED_FIELDS = ["image_id", "category_id", Const.MODE_BBOX, "score"]
+# category_name of a pred table names the categories which the gt does not have
+PRED_TABLE_COLUMNS = PRED_FIELDS + ["category_name"]
+
 
 class PredJson(object):
-    def __init__(self, file_path: str):
+    def __init__(
+        self,
+        file_path: str = None,
+        streaming: bool = False,
+        min_score: float = None,
+        max_per_image: int = None,
+        max_per_category: int = None,
+    ):
+        for name, value in [
+            ("max_per_image", max_per_image),
+            ("max_per_category", max_per_category),
+        ]:
+            if value is not None and value < 1:
+                raise ValueError(f"{name} has to be 1 or more but got {value}.")
+
+        self._annotations = {}
+        self._categories = {}
+        self._streaming = streaming
+        # predictions dropped while reading, they are never evaluated
+        self._min_score = min_score
+        self._max_per_image = max_per_image
+        self._max_per_category = max_per_category
+
+        # no file, predictions are added later
+        if file_path is None:
+            return
+
+        # one prediction or one image per line, read line by line
+        if file_path.endswith(Const.JSON_LINES_SUFFIX):
+            self.add_annotation_list(iter_json_lines_annotations(file_path))
+            return
+
+        # parquet or arrow table, only the columns used are read
+        if is_table_file(file_path):
+            self.add_annotation_list(
+                self._pop_category_names(iter_table_annotations(file_path, PRED_TABLE_COLUMNS))
+            )
+            return
+
+        # columns saved by save_binary, mapped instead of parsed
+        if is_binary_annotation_file(file_path):
+            binary_annotations = BinaryAnnotations(file_path)
+            self._categories = binary_annotations.get_categories()
+            if min_score is None and max_per_image is None and max_per_category is None:
+                self._annotations = binary_annotations
+            else:
+                self.add_annotation_list(
+                    annotation
+                    for annotations in binary_annotations.values()
+                    for annotation in annotations
+                )
+            return
+
+        # streaming keeps only PRED_FIELDS and never loads the whole json
+        if streaming:
+            self.add_annotation_list(_iter_streaming_annotations(file_path))
+            return
+
         with open(file_path, "r") as json_file:
             pred_json = json.load(json_file)
-        self._annotations = {}
 
         pred_json_list = []
         if type(pred_json) == list:
@@ -18,15 +91,132 @@ class PredJson(object):
                         for anno in annotation.get("segments_info", []):
                             anno["image_id"] = image_id
                             pred_json_list.append(anno)
+        self.add_annotation_list(pred_json_list)
+
+    def add_annotation_list(self, annotations):
+        """
+        add predictions of images not added yet, filtered like the ones read from the file.
+        """
+        annotations = self._filter_annotations(annotations)
+        if self._is_top_only():
+            self._add_top_annotation_list(annotations)
+            return
 
-        for annotation in pred_json_list:
+        for annotation in annotations:
             image_id = annotation.get("image_id")
             if self._annotations.get(image_id, "") == "":
                 self._annotations[image_id] = []
             self._annotations[image_id].append(annotation)
 
+    def _pop_category_names(self, annotations):
+        for annotation in annotations:
+            category_name = annotation.pop("category_name", None)
+            if category_name is not None:
+                self._categories.setdefault(annotation.get("category_id", -1), category_name)
+            yield annotation
+
+    def _filter_annotations(self, annotations):
+        if self._streaming:
+            annotations = (_get_pred_fields(annotation) for annotation in annotations)
+        if self._min_score is not None:
+            annotations = (
+                annotation
+                for annotation in annotations
+                if annotation.get("score", -1) >= self._min_score
+            )
+        return annotations
+
+    def _is_top_only(self):
+        return self._max_per_image is not None or self._max_per_category is not None
+
+    def _add_top_annotation_list(self, annotations, image_id: int = None):
+        """
+        keep the highest scores per image, or per image and category, in the order read.
+        all annotations are of image_id when it is given.
+        """
+        is_per_category = self._max_per_category is not None
+        max_count = self._max_per_category if is_per_category else self._max_per_image
+        # min heaps of (score, -order, annotation), of equal scores the later one is dropped
+        heaps = {}
+        for order, annotation in enumerate(annotations):
+            annotation_image_id = annotation.get("image_id") if image_id is None else image_id
+            key = (
+                (annotation_image_id, annotation.get("category_id"))
+                if is_per_category
+                else annotation_image_id
+            )
+            heap = heaps.setdefault(key, [])
+            item = (annotation.get("score", -1), -order, annotation)
+            if len(heap) < max_count:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+
+        image_items = {}
+        for key, heap in heaps.items():
+            annotation_image_id = key[0] if is_per_category else key
+            image_items.setdefault(annotation_image_id, []).extend(heap)
+        for annotation_image_id, items in image_items.items():
+            if is_per_category and self._max_per_image is not None:
+                items = sorted(items, key=lambda item: item[:2], reverse=True)
+                items = items[: self._max_per_image]
+            items = sorted(items, key=lambda item: -item[1])
+            self._annotations[annotation_image_id] = [annotation for _, _, annotation in items]
+
+    def add_annotations(self, image_id: int, annotations: list):
+        # new list, images matched before keep their predictions
+        self._annotations[image_id] = self._annotations.get(image_id, []) + list(
+            self._filter_annotations(annotations)
+        )
+        if self._is_top_only():
+            # the highest scores of the predictions added before and the new ones
+            self._add_top_annotation_list(self._annotations[image_id], image_id)
+
+    def get_options(self):
+        """
+        keyword arguments reading another file with the same filters.
+        """
+        return {
+            "streaming": self._streaming,
+            "min_score": self._min_score,
+            "max_per_image": self._max_per_image,
+            "max_per_category": self._max_per_category,
+        }
+
+    def save_binary(self, file_path: str):
+        save_binary_annotations(file_path, self._annotations, categories=self._categories)
+
     def get_annotations(self):
         return self._annotations
 
+    def get_categories(self):
+        """
+        category id -> name read with the predictions, only pred tables have them.
+        """
+        return self._categories
+
     def get_annotation_by_image_id(self, image_id: int):
         return self._annotations.get(image_id, [])
+
+
+def _iter_streaming_annotations(file_path: str):
+    with open(file_path, "r") as json_file:
+        stream = JsonStream(json_file)
+        if stream.peek() == "[":
+            yield from stream.iter_array()
+            return
+
+        # panoptic layout, segments of each annotation are predictions
+        for key in stream.iter_object():
+            if key != "annotations":
+                stream.skip()
+                continue
+            for annotation in stream.iter_array():
+                image_id = annotation.get("image_id")
+                for anno in annotation.get("segments_info", []):
+                    anno["image_id"] = image_id
+                    yield anno
+
+
+def _get_pred_fields(annotation: dict):
+    return {field: annotation[field] for field in PRED_FIELDS if field in annotation}
@@ -1,27 +1,138 @@
 import math
 import os
 import platform
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import PIL
 from PIL import ImageDraw, ImageFont
 
+import nobunaga.constants as Const
 
-def write_label(image_path: str, new_file_path: str, bboxes: dict, col_size: int):
+
+class ImageCache(object):
+    """
+    decoded RGB images by path, the least recently used are dropped over max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = Const.IMAGE_CACHE_MAX_BYTES):
+        self._max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._total_bytes = 0
+
+    def get(self, image_path: str, max_side: int = None):
+        """
+        (decoded image, scale from the file), the image is shared and must not be drawn on.
+        """
+        key = (image_path, max_side)
+        decoded_image = self._images.get(key)
+        if decoded_image is not None:
+            self._images.move_to_end(key)
+            return decoded_image
+
+        decoded_image = _open_image(image_path, max_side)
+        image_bytes = _get_image_bytes(decoded_image[0])
+        if image_bytes <= self._max_bytes:
+            self._images[key] = decoded_image
+            self._total_bytes += image_bytes
+            while self._total_bytes > self._max_bytes:
+                _, (dropped_image, _) = self._images.popitem(last=False)
+                self._total_bytes -= _get_image_bytes(dropped_image)
+        return decoded_image
+
+
+class ImageWriter(object):
+    """
+    encode and write images in worker threads behind drawing.
+    at most queue_size images wait to be written, write() blocks while the queue is full.
+    """
+
+    def __init__(
+        self,
+        workers: int = Const.RENDER_WRITE_WORKERS,
+        queue_size: int = Const.RENDER_WRITE_QUEUE_SIZE,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._queue_size = max(queue_size, 1)
+        self._futures = deque()
+
+    def write(self, image, file_path: str):
+        while len(self._futures) >= self._queue_size:
+            self._futures.popleft().result()
+        self._futures.append(self._executor.submit(_save_image, image, file_path))
+
+    def close(self):
+        while self._futures:
+            self._futures.popleft().result()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_decoded_images(
+    image_paths: list,
+    workers: int = Const.RENDER_DECODE_WORKERS,
+    queue_size: int = Const.RENDER_DECODE_QUEUE_SIZE,
+    max_side: int = None,
+):
+    """
+    yield (decoded image, scale from the file) of each path in order,
+    the image is None when it can not be decoded.
+    up to queue_size images are decoded ahead in worker threads.
+    """
+    image_paths = iter(image_paths)
+    futures = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for image_path in image_paths:
+                futures.append(executor.submit(_try_open_image, image_path, max_side))
+                if len(futures) >= max(queue_size, 1):
+                    break
+            if not futures:
+                return
+            yield futures.popleft().result()
+
+
+def write_label(
+    image_path: str,
+    new_file_path: str,
+    bboxes: dict,
+    col_size: int,
+    image_cache: ImageCache = None,
+    max_side: int = None,
+):
+    # the image is decoded once for all panels without a shared cache
+    if image_cache is None:
+        image_cache = ImageCache()
+    try:
+        image, scale = image_cache.get(image_path, max_side)
+    except:
+        image, scale = None, 1.0
+    merged_image = draw_label(image, bboxes, col_size, scale)
+    if merged_image is None:
+        return None
+    return _save_image(merged_image, new_file_path)
+
+
+def draw_label(source_image, bboxes: dict, col_size: int, scale: float = 1.0):
+    """
+    panels of bboxes drawn on copies of the decoded image, merged in col_size columns.
+    bboxes are multiplied by scale, the size of the decoded image to the file.
+    None when there is no image.
+    """
+    if source_image is None:
+        return None
     images = []
     image_height = 0
     image_width = 0
-    error_count = 0
     for title, bbox_list in bboxes.items():
-        try:
-            image = PIL.Image.open(image_path)
-        except:
-            error_count += 1
-            continue
-
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        image = source_image.copy()
 
         score_format = ": {:.1f}"
         text_size = 16
@@ -30,11 +141,11 @@ def write_label(image_path: str, new_file_path: str, bboxes: dict, col_size: int
         if len(bbox_list) > 0:
             for bbox in bbox_list:
                 name = bbox[0]
-                left = bbox[1]
-                width = bbox[3]
+                left = bbox[1] * scale
+                width = bbox[3] * scale
                 right = left + width
-                top = bbox[2]
-                height = bbox[4]
+                top = bbox[2] * scale
+                height = bbox[4] * scale
                 bottom = top + height
                 score = bbox[5]
                 color = (0, 255, 0)
@@ -62,7 +173,7 @@ def write_label(image_path: str, new_file_path: str, bboxes: dict, col_size: int
         image_width = image.width
         images.append(image)
 
-    row_count = math.ceil((len(bboxes) - error_count) / col_size)
+    row_count = math.ceil(len(bboxes) / col_size)
     if not row_count:
         return None
     merged_image = PIL.Image.new("RGB", (image_width * col_size, image_height * row_count))
@@ -75,12 +186,52 @@ def write_label(image_path: str, new_file_path: str, bboxes: dict, col_size: int
             row_index += 1
         else:
             col_index += 1
+    return merged_image
+
+
+def _open_image(image_path: str, max_side: int = None):
+    """
+    (RGB image, scale from the file) whose longer side is at most max_side.
+    """
+    image = PIL.Image.open(image_path)
+    file_width = image.width
+    size = None
+    if max_side and max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        size = (max(round(image.width * ratio), 1), max(round(image.height * ratio), 1))
+        # jpeg is decoded at 1/2, 1/4 or 1/8 of the size, not smaller than the given size
+        image.draft("RGB", size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if size is not None:
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor > 1:
+            image = image.reduce(factor)
+        if image.size != size:
+            image = image.resize(size, PIL.Image.BILINEAR)
+    image.load()
+    if image.width == file_width:
+        return image, 1.0
+    return image, image.width / file_width
+
+
+def _try_open_image(image_path: str, max_side: int = None):
+    try:
+        return _open_image(image_path, max_side)
+    except:
+        return None, 1.0
+
+
+def _save_image(image, file_path: str):
     try:
-        merged_image.save(new_file_path)
+        image.save(file_path)
     except:
         return None
+    return file_path
+
 
-    return new_file_path
+def _get_image_bytes(image):
+    return image.width * image.height * len(image.getbands())
 
 
 def get_font(text_size: int):
@@ -1,4 +1,5 @@
 from .gt_label import GtLabel
 from .label import Label
+from .label_table import LabelTable
 from .pred_label import PredLabel
-from .nobunaga_image import Image
+from .nobunaga_image import Image, calculate_image_ious
@@ -17,18 +17,78 @@ class Label(object):
         unmatch_gt_category_label: GtLabel,
         iou_threshold: float,
         confidence_threshold: float,
+        max_match_gt_category_iou: float = None,
+        max_unmatch_gt_category_iou: float = None,
     ):
         self._image_id = image_id
         self._image_name = image_name
         self._pred_label = pred_label
         self._duplicate_pred_labels = []
+        self._duplicate_pred_ious = []
         self._match_gt_category_label = match_gt_category_label
         self._unmatch_gt_category_label = unmatch_gt_category_label
         self._iou_threshold = iou_threshold
         self._confidence_threshold = confidence_threshold
 
-    def add_duplicate_pred_labels(self, label: PredLabel):
+        # ious are given by Image, otherwise calculated here once.
+        if max_match_gt_category_iou is None:
+            max_match_gt_category_iou = self._calculate_iou(self._match_gt_category_label)
+        if max_unmatch_gt_category_iou is None:
+            max_unmatch_gt_category_iou = self._calculate_iou(self._unmatch_gt_category_label)
+        if not self._pred_label or not self._match_gt_category_label:
+            max_match_gt_category_iou = 0
+        if not self._pred_label or not self._unmatch_gt_category_label:
+            max_unmatch_gt_category_iou = 0
+        self._max_match_gt_category_iou = max_match_gt_category_iou
+        self._max_unmatch_gt_category_iou = max_unmatch_gt_category_iou
+
+        # errors only depending on ious never change.
+        match_iou = self._max_match_gt_category_iou
+        unmatch_iou = self._max_unmatch_gt_category_iou
+        self._is_background_error = (
+            0 < unmatch_iou <= match_iou < Const.THRESHOLD_MIN_DETECTED
+        ) or (
+            self._pred_label is not None
+            and self._match_gt_category_label is None
+            and self._unmatch_gt_category_label is None
+        )
+        self._is_class_error = (
+            self.get_pred_category_id() != self.get_max_unmatch_gt_category_id()
+            and unmatch_iou > match_iou
+            and unmatch_iou >= self._iou_threshold
+        )
+        self._is_location_error = (
+            self._iou_threshold > match_iou > Const.THRESHOLD_MIN_DETECTED
+            and match_iou >= unmatch_iou
+        )
+        self._is_both_error = (
+            self.get_pred_category_id() != self.get_max_unmatch_gt_category_id()
+            and unmatch_iou > match_iou
+            and self._iou_threshold > unmatch_iou > Const.THRESHOLD_MIN_DETECTED
+        )
+        self._is_miss_error = (
+            self._pred_label is None
+            and self._match_gt_category_label is not None
+            and self._unmatch_gt_category_label is None
+        )
+        self._is_true_positive = match_iou >= self._iou_threshold and match_iou > unmatch_iou
+
+        # errors depending on duplicates are cached until a duplicate is added.
+        self._error_type = None
+        self._correct_distance = None
+
+    def _calculate_iou(self, gt_label: GtLabel):
+        if not self._pred_label or not gt_label:
+            return 0
+        return calculate_iou(gt_label.get_bbox(), self._pred_label.get_bbox())
+
+    def add_duplicate_pred_labels(self, label: PredLabel, iou: float = None):
+        if iou is None:
+            iou = calculate_iou(self._match_gt_category_label.get_bbox(), label.get_bbox())
         self._duplicate_pred_labels.append(label)
+        self._duplicate_pred_ious.append(iou)
+        self._error_type = None
+        self._correct_distance = None
 
     def get_image_id(self):
         return self._image_id
@@ -42,6 +102,9 @@ class Label(object):
     def get_duplicate_pred_labels(self):
         return self._duplicate_pred_labels
 
+    def get_duplicate_pred_ious(self):
+        return self._duplicate_pred_ious
+
     def get_gt_match_label(self):
         return self._match_gt_category_label
 
@@ -64,84 +127,50 @@ class Label(object):
         return self._unmatch_gt_category_label.get_category_id()
 
     def get_max_match_gt_category_iou(self):
-        if not self._pred_label or not self._match_gt_category_label:
-            return 0
-        return calculate_iou(self._match_gt_category_label.get_bbox(), self._pred_label.get_bbox())
+        return self._max_match_gt_category_iou
 
     def get_max_unmatch_gt_category_iou(self):
-        if not self._pred_label or not self._unmatch_gt_category_label:
-            return 0
-        return calculate_iou(
-            self._unmatch_gt_category_label.get_bbox(), self._pred_label.get_bbox()
-        )
+        return self._max_unmatch_gt_category_iou
 
     def is_background_error(self):
-        return (
-            0
-            < self.get_max_unmatch_gt_category_iou()
-            <= self.get_max_match_gt_category_iou()
-            < Const.THRESHOLD_MIN_DETECTED
-        ) or (
-               self._pred_label is not None
-            and self._match_gt_category_label is None
-            and self._unmatch_gt_category_label is None
-        )
+        return self._is_background_error
 
     def is_class_error(self):
-        return (
-            self.get_pred_category_id() != self.get_max_unmatch_gt_category_id()
-            and self.get_max_unmatch_gt_category_iou() > self.get_max_match_gt_category_iou()
-            and self.get_max_unmatch_gt_category_iou() >= self._iou_threshold
-        )
+        return self._is_class_error
 
     def is_location_error(self):
-        return (
-            self._iou_threshold
-            > self.get_max_match_gt_category_iou()
-            > Const.THRESHOLD_MIN_DETECTED
-            and self.get_max_match_gt_category_iou() >= self.get_max_unmatch_gt_category_iou()
-        )
+        return self._is_location_error
 
     def is_both_error(self):
-        return (
-            self.get_pred_category_id() != self.get_max_unmatch_gt_category_id()
-            and self.get_max_unmatch_gt_category_iou() > self.get_max_match_gt_category_iou()
-            and (
-                self._iou_threshold
-                > self.get_max_unmatch_gt_category_iou()
-                > Const.THRESHOLD_MIN_DETECTED
-            )
-        )
+        return self._is_both_error
 
     def is_miss_error(self):
-        return (
-            self._pred_label is None
-            and self._match_gt_category_label is not None
-            and self._unmatch_gt_category_label is None
-        )
+        return self._is_miss_error
 
     def is_duplicate_error(self):
         return len(self._duplicate_pred_labels) > 0
 
     def is_true_positive(self):
-        return (
-            self.get_max_match_gt_category_iou() >= self._iou_threshold
-            and self.get_max_match_gt_category_iou() > self.get_max_unmatch_gt_category_iou()
-        )
+        return self._is_true_positive
 
     def is_false_positive(self):
         return (
-            self.is_background_error()
-            or self.is_class_error()
-            or self.is_both_error()
-            or self.is_location_error()
+            self._is_background_error
+            or self._is_class_error
+            or self._is_both_error
+            or self._is_location_error
             or self.is_duplicate_error()
         )
 
     def is_false_negative(self):
-        return self.is_miss_error()
+        return self._is_miss_error
 
     def get_error_type(self):
+        if self._error_type is None:
+            self._error_type = self._get_error_type()
+        return self._error_type
+
+    def _get_error_type(self):
         if self.is_both_error():
             return Const.ERROR_TYPE_BOTH
         elif self.is_duplicate_error():
@@ -161,6 +190,11 @@ class Label(object):
         """
         [Cls, Loc, Both, Dupe, Bkg, Miss, No Error, All Errors]
         """
+        if self._correct_distance is None:
+            self._correct_distance = self._get_correct_distance()
+        return list(self._correct_distance)
+
+    def _get_correct_distance(self):
         match_distance = (
             -math.log(self.get_max_match_gt_category_iou(), 10)
             if self.get_max_match_gt_category_iou() > 0
@@ -203,10 +237,7 @@ class Label(object):
         elif self.is_duplicate_error():
             max_iou = 0.0
             distance = 0.0
-            for duplicate_pred_label in self._duplicate_pred_labels:
-                iou = calculate_iou(
-                    self._match_gt_category_label.get_bbox(), duplicate_pred_label.get_bbox()
-                )
+            for iou in self._duplicate_pred_ious:
                 if iou >= max_iou:
                     max_iou = iou
                     if iou > 0.0:
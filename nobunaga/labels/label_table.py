@@ -0,0 +1,173 @@
+import numpy as np
+
+import nobunaga.constants as Const
+from nobunaga.utils import create_id_array
+
+from .label import Label
+
+# bit of each error in the flags column, in the order of Const.MAIN_ERRORS
+FLAG_TRUE_POSITIVE = 1 << len(Const.MAIN_ERRORS)
+CORRECT_DISTANCE_SIZE = 8
+# image and category ids, int64 columns of integer ids and object columns of the others
+ID_COLUMNS = ["image_id", "pred_category_id", "match_gt_category_id", "unmatch_gt_category_id"]
+
+
+class LabelTable(object):
+    """
+    labels stored column by column. one row per Label, missing labels and ids are -1.
+    """
+
+    def __init__(self, columns: dict):
+        self._columns = columns
+
+    @staticmethod
+    def from_labels(labels: list):
+        count = len(labels)
+        columns = _create_columns(count)
+        duplicate_counts = np.zeros(count, dtype=np.int64)
+        duplicate_pred_indices = []
+        duplicate_ious = []
+        ids = {name: [] for name in ID_COLUMNS}
+        for row, label in enumerate(labels):
+            ids["image_id"].append(label.get_image_id())
+            pred_label = label.get_pred_label()
+            if pred_label is not None:
+                columns["pred_index"][row] = pred_label.get_index()
+                columns["pred_confidence"][row] = pred_label.get_confidence()
+            if label.get_gt_match_label() is not None:
+                columns["match_gt_index"][row] = label.get_gt_match_label().get_index()
+            if label.get_gt_unmatch_label() is not None:
+                columns["unmatch_gt_index"][row] = label.get_gt_unmatch_label().get_index()
+            ids["pred_category_id"].append(label.get_pred_category_id())
+            ids["match_gt_category_id"].append(label.get_max_match_gt_category_id())
+            ids["unmatch_gt_category_id"].append(label.get_max_unmatch_gt_category_id())
+            columns["match_gt_category_iou"][row] = label.get_max_match_gt_category_iou()
+            columns["unmatch_gt_category_iou"][row] = label.get_max_unmatch_gt_category_iou()
+            error_type = label.get_error_type()
+            if error_type:
+                columns["error_type"][row] = Const.MAIN_ERRORS.index(error_type)
+            columns["flags"][row] = _get_flags(label)
+            columns["correct_distance"][row] = label.get_correct_distance()
+
+            duplicate_pred_labels = label.get_duplicate_pred_labels()
+            duplicate_counts[row] = len(duplicate_pred_labels)
+            duplicate_pred_indices.extend([pred.get_index() for pred in duplicate_pred_labels])
+            duplicate_ious.extend(label.get_duplicate_pred_ious())
+
+        for name, values in ids.items():
+            columns[name] = create_id_array(values)
+        # duplicates of row i are at duplicate_offsets[i]:duplicate_offsets[i + 1]
+        columns["duplicate_offsets"] = np.concatenate([[0], np.cumsum(duplicate_counts)])
+        columns["duplicate_pred_index"] = np.array(duplicate_pred_indices, dtype=np.int64)
+        columns["duplicate_iou"] = np.array(duplicate_ious, dtype=np.float64)
+        return LabelTable(columns)
+
+    @staticmethod
+    def concatenate(tables: list):
+        columns = _create_columns(0)
+        offset = 0
+        offsets = [columns["duplicate_offsets"]]
+        for table in tables:
+            offsets.append(table.get_column("duplicate_offsets")[1:] + offset)
+            offset += table.get_column("duplicate_offsets")[-1]
+        for name in columns.keys():
+            if name == "duplicate_offsets":
+                columns[name] = np.concatenate(offsets)
+            else:
+                columns[name] = np.concatenate(
+                    [columns[name]] + [table.get_column(name) for table in tables]
+                )
+        return LabelTable(columns)
+
+    def slice(self, start: int, end: int):
+        columns = {}
+        duplicate_offsets = self._columns["duplicate_offsets"][start : end + 1]
+        for name, column in self._columns.items():
+            if name == "duplicate_offsets":
+                columns[name] = duplicate_offsets - duplicate_offsets[0]
+            elif name in ["duplicate_pred_index", "duplicate_iou"]:
+                columns[name] = column[duplicate_offsets[0] : duplicate_offsets[-1]]
+            else:
+                columns[name] = column[start:end]
+        return LabelTable(columns)
+
+    def __len__(self):
+        return len(self._columns["image_id"])
+
+    def get_column_names(self):
+        return list(self._columns.keys())
+
+    def get_column(self, name: str):
+        return self._columns[name]
+
+    def get_error_mask(self, error_type: str):
+        return (self._columns["flags"] & (1 << Const.MAIN_ERRORS.index(error_type))) > 0
+
+    def get_true_positive_mask(self):
+        return (self._columns["flags"] & FLAG_TRUE_POSITIVE) > 0
+
+    def get_false_positive_mask(self):
+        false_positive_flags = sum(
+            1 << Const.MAIN_ERRORS.index(error_type)
+            for error_type in Const.MAIN_ERRORS
+            if error_type != Const.ERROR_TYPE_MISS
+        )
+        return (self._columns["flags"] & false_positive_flags) > 0
+
+    def get_false_negative_mask(self):
+        return self.get_error_mask(Const.ERROR_TYPE_MISS)
+
+    def get_duplicates(self, row: int):
+        start = self._columns["duplicate_offsets"][row]
+        end = self._columns["duplicate_offsets"][row + 1]
+        return (
+            self._columns["duplicate_pred_index"][start:end],
+            self._columns["duplicate_iou"][start:end],
+        )
+
+    def get_correct_distance(self):
+        """
+        [Cls, Loc, Both, Dupe, Bkg, Miss, No Error, All Errors] summed in row order
+        """
+        if len(self) == 0:
+            return [0.0] * CORRECT_DISTANCE_SIZE
+        return np.cumsum(self._columns["correct_distance"], axis=0)[-1].tolist()
+
+
+def _create_columns(count: int):
+    return {
+        "image_id": np.zeros(count, dtype=np.int64),
+        "pred_index": np.full(count, -1, dtype=np.int64),
+        "match_gt_index": np.full(count, -1, dtype=np.int64),
+        "unmatch_gt_index": np.full(count, -1, dtype=np.int64),
+        "pred_category_id": np.full(count, -1, dtype=np.int64),
+        "match_gt_category_id": np.full(count, -1, dtype=np.int64),
+        "unmatch_gt_category_id": np.full(count, -1, dtype=np.int64),
+        "pred_confidence": np.full(count, -1, dtype=np.float64),
+        "match_gt_category_iou": np.zeros(count, dtype=np.float64),
+        "unmatch_gt_category_iou": np.zeros(count, dtype=np.float64),
+        "error_type": np.full(count, -1, dtype=np.int8),
+        "flags": np.zeros(count, dtype=np.uint8),
+        "correct_distance": np.zeros((count, CORRECT_DISTANCE_SIZE), dtype=np.float64),
+        "duplicate_offsets": np.zeros(1, dtype=np.int64),
+        "duplicate_pred_index": np.zeros(0, dtype=np.int64),
+        "duplicate_iou": np.zeros(0, dtype=np.float64),
+    }
+
+
+def _get_flags(label: Label):
+    flags = 0
+    predicates = {
+        Const.ERROR_TYPE_CLASS: label.is_class_error,
+        Const.ERROR_TYPE_LOCATION: label.is_location_error,
+        Const.ERROR_TYPE_BOTH: label.is_both_error,
+        Const.ERROR_TYPE_DUPLICATE: label.is_duplicate_error,
+        Const.ERROR_TYPE_BACKGROUND: label.is_background_error,
+        Const.ERROR_TYPE_MISS: label.is_miss_error,
+    }
+    for error_type, predicate in predicates.items():
+        if predicate():
+            flags |= 1 << Const.MAIN_ERRORS.index(error_type)
+    if label.is_true_positive():
+        flags |= FLAG_TRUE_POSITIVE
+    return flags
@@ -1,8 +1,14 @@
 import numpy as np
 
 import nobunaga.constants as Const
-from nobunaga.labels import GtLabel, Label, PredLabel
-from nobunaga.utils import calculate_ious
+from nobunaga.io.gt_json import create_gt_arrays
+from nobunaga.labels import GtLabel, Label, LabelTable, PredLabel
+from nobunaga.utils import (
+    calculate_iou_matrix,
+    calculate_sparse_ious,
+    get_sparse_ious,
+    sparse_argmax,
+)
 
 
 class Image(object):
@@ -14,6 +20,10 @@ class Image(object):
         preds: dict,
         iou_threshold: float,
         confidence_threshold: float,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+        iou=None,
+        label_table: LabelTable = None,
+        gt_arrays: tuple = None,
     ):
         self._image = image
         self._categories = categories
@@ -22,6 +32,11 @@ class Image(object):
         self._iou_threshold = iou_threshold
         self._confidence_threshold = confidence_threshold
 
+        # labels already matched elsewhere, e.g. in another process
+        if label_table is not None:
+            self._label_table = label_table
+            return
+
         # relation dict between position and category id
         self._pred_category_row_relations = {}
         for index, pred in enumerate(self._preds):
@@ -32,37 +47,45 @@ class Image(object):
         for index, gt in enumerate(self._gts):
             self._gt_category_column_relations[index] = gt.get("category_id", -1)
 
+        # (bboxes, category ids) of gts, can be shared between evaluations of the same gts.
+        if gt_arrays is None:
+            gt_arrays = create_gt_arrays(self._gts)
+        self._gt_bbox_array, self._gt_category_array = gt_arrays
+
+        # iou can be shared between images of the same gts and preds.
+        if iou is None:
+            iou = calculate_image_ious(
+                self._gts, self._preds, sparse_box_count, self._gt_bbox_array
+            )
+
+        # labels are kept as columns, Label objects are created on demand
+        self._label_table = LabelTable.from_labels(self._create_labels(iou))
+
+    def _create_labels(self, iou):
         # row: predict, col: gt
         gt_bboxes = [gt[Const.MODE_BBOX] for gt in self._gts]
         gt_error_types = [None for gt in self._gts]
         pred_bboxes = [pred[Const.MODE_BBOX] for pred in self._preds]
-        self._iou = calculate_ious(gt_bboxes, pred_bboxes)
-
-        self._is_confident_matrix = np.array(
-            [
-                [pred.get("score") >= self._confidence_threshold] * len(self._gts)
-                for pred in self._preds
-            ]
-        )
-
-        # matrix has true when pred class and ground truth equals
-        self._match_gt_category = [[]]
-        if len(self._gts) > 0:
-            pred_categories = np.array([pred.get("category_id", "") for pred in self._preds])
-            gt_categories = np.array([gt.get("category_id", "") for gt in self._gts])
-            self._match_gt_category = pred_categories[:, None] == gt_categories[None, :]
 
         # get all predicted label
-        self._labels = []
-        if len(self._iou) == 0:
-            return
-        match_gt_category_matrix = (
-                self._iou * self._is_confident_matrix * self._match_gt_category
-        )
-        unmatch_gt_category_matrix = (
-                self._iou * self._is_confident_matrix * ~self._match_gt_category
-        )
-        for pred_row_index, match_row in enumerate(match_gt_category_matrix):
+        labels = []
+        if len(self._preds) == 0:
+            return labels
+        if isinstance(iou, tuple):
+            max_ious = self._get_sparse_max_ious(iou)
+        else:
+            max_ious = self._get_dense_max_ious(iou)
+        (
+            max_match_gt_category_indices,
+            max_unmatch_gt_category_indices,
+            max_match_gt_category_ious,
+            max_unmatch_gt_category_ious,
+            max_confident_ious,
+        ) = max_ious
+
+        # gt index -> first label detecting the gt above iou threshold
+        true_positive_labels = {}
+        for pred_row_index in range(len(self._preds)):
             # pred label
             pred_category_id = self._pred_category_row_relations.get(pred_row_index, -1)
             pred_bbox = pred_bboxes[pred_row_index]
@@ -77,7 +100,7 @@ class Image(object):
             )
 
             # match gt label
-            max_match_gt_category_index = np.argmax(match_row)
+            max_match_gt_category_index = max_match_gt_category_indices[pred_row_index]
             match_gt_category_id = self._gt_category_column_relations.get(
                 max_match_gt_category_index, -1
             )
@@ -91,8 +114,7 @@ class Image(object):
             )
 
             # unmatch gt label
-            unmatch_gt_category_row = unmatch_gt_category_matrix[pred_row_index]
-            max_unmatch_gt_category_index = np.argmax(unmatch_gt_category_row)
+            max_unmatch_gt_category_index = max_unmatch_gt_category_indices[pred_row_index]
             unmatch_gt_category_id = self._gt_category_column_relations.get(
                 max_unmatch_gt_category_index, -1
             )
@@ -113,38 +135,33 @@ class Image(object):
                 unmatch_gt_category_label,
                 self._iou_threshold,
                 self._confidence_threshold,
+                float(max_match_gt_category_ious[pred_row_index]),
+                float(max_unmatch_gt_category_ious[pred_row_index]),
             )
 
             if gt_error_types[max_match_gt_category_index] is None:
                 gt_error_types[max_match_gt_category_index] = label.get_error_type()
-                self._labels.append(label)
+                labels.append(label)
+                if label.is_true_positive():
+                    true_positive_labels[max_match_gt_category_index] = label
             else:
-                is_duplicate_error = False
-                for exist_label in self._labels:
-                    # duplicate error(more than 2 pred detect same gt)
-                    if (
-                        exist_label.get_gt_match_label().get_index()
-                        == label.get_gt_match_label().get_index()
-                        and label.get_max_match_gt_category_iou() >= self._iou_threshold
-                        and label.get_max_match_gt_category_iou()
-                        > label.get_max_unmatch_gt_category_iou()
-                        and exist_label.get_max_match_gt_category_iou() >= self._iou_threshold
-                        and exist_label.get_max_match_gt_category_iou()
-                        > exist_label.get_max_unmatch_gt_category_iou()
-                    ):
-                        exist_label.add_duplicate_pred_labels(label.get_pred_label())
-                        gt_error_types[max_match_gt_category_index] = Const.ERROR_TYPE_DUPLICATE
-                        is_duplicate_error = True
-                        break
-                if not is_duplicate_error:
+                # duplicate error(more than 2 pred detect same gt)
+                exist_label = true_positive_labels.get(max_match_gt_category_index)
+                if exist_label is not None and label.is_true_positive():
+                    exist_label.add_duplicate_pred_labels(
+                        label.get_pred_label(), label.get_max_match_gt_category_iou()
+                    )
+                    gt_error_types[max_match_gt_category_index] = Const.ERROR_TYPE_DUPLICATE
+                else:
                     gt_error_types[max_match_gt_category_index] = label.get_error_type()
-                    self._labels.append(label)
+                    labels.append(label)
+                    if label.is_true_positive():
+                        true_positive_labels[max_match_gt_category_index] = label
 
         # background error label (detected but no gt exists.)
-        iou_matrix = self._iou * self._is_confident_matrix
-        for pred_index, iou in enumerate(iou_matrix):
+        for pred_index, max_iou in enumerate(max_confident_ious):
             if (
-                iou[np.argmax(iou)] == 0
+                max_iou == 0
                 and self._preds[pred_index].get("score", -1) > self._confidence_threshold
             ):
                 pred_category_id = self._pred_category_row_relations.get(pred_index, -1)
@@ -167,7 +184,7 @@ class Image(object):
                     self._iou_threshold,
                     self._confidence_threshold,
                 )
-                self._labels.append(label)
+                labels.append(label)
 
         for gt_index, gt_error_type in enumerate(gt_error_types):
             if gt_error_type is not None:
@@ -191,8 +208,70 @@ class Image(object):
                 self._confidence_threshold,
             )
             if gt_error_types[gt_index] is None:
-                self._labels.append(label)
+                labels.append(label)
                 gt_error_types[gt_index] = label.get_error_type()
+        return labels
+
+    def _get_dense_max_ious(self, iou: np.ndarray):
+        is_confident_matrix = np.array(
+            [
+                [pred.get("score") >= self._confidence_threshold] * len(self._gts)
+                for pred in self._preds
+            ]
+        )
+
+        # matrix has true when pred class and ground truth equals
+        pred_categories = np.array([pred.get("category_id", "") for pred in self._preds])
+        gt_categories = self._gt_category_array
+        match_gt_category = pred_categories[:, None] == gt_categories[None, :]
+
+        match_gt_category_matrix = iou * is_confident_matrix * match_gt_category
+        unmatch_gt_category_matrix = iou * is_confident_matrix * ~match_gt_category
+        confident_iou_matrix = iou * is_confident_matrix
+        match_indices = np.argmax(match_gt_category_matrix, axis=1)
+        unmatch_indices = np.argmax(unmatch_gt_category_matrix, axis=1)
+        rows = np.arange(len(self._preds))
+        confident_ious = confident_iou_matrix[rows, np.argmax(confident_iou_matrix, axis=1)]
+
+        # iou without masks for labels
+        return (
+            match_indices,
+            unmatch_indices,
+            iou[rows, match_indices],
+            iou[rows, unmatch_indices],
+            confident_ious,
+        )
+
+    def _get_sparse_max_ious(self, iou: tuple):
+        pred_indices, gt_indices, ious = iou
+        pred_count = len(self._preds)
+        gt_count = len(self._gts)
+        is_confident = np.array(
+            [pred.get("score") >= self._confidence_threshold for pred in self._preds]
+        )[pred_indices]
+
+        # true when pred class and ground truth equals
+        pred_categories = np.array([pred.get("category_id", "") for pred in self._preds])
+        gt_categories = self._gt_category_array
+        is_match = pred_categories[pred_indices] == gt_categories[gt_indices]
+
+        match_indices, _ = sparse_argmax(
+            *[x[is_confident & is_match] for x in iou], pred_count, gt_count
+        )
+        unmatch_indices, _ = sparse_argmax(
+            *[x[is_confident & ~is_match] for x in iou], pred_count, gt_count
+        )
+        _, confident_ious = sparse_argmax(*[x[is_confident] for x in iou], pred_count, gt_count)
+
+        # iou without masks for labels
+        rows = np.arange(pred_count)
+        return (
+            match_indices,
+            unmatch_indices,
+            get_sparse_ious(*iou, rows, match_indices, gt_count),
+            get_sparse_ious(*iou, rows, unmatch_indices, gt_count),
+            confident_ious,
+        )
 
     def get_image_id(self):
         return self._image.get("id", -1)
@@ -206,76 +285,154 @@ class Image(object):
     def get_preds(self):
         return self._preds
 
+    def get_label_table(self):
+        return self._label_table
+
     def get_labels(self):
-        return self._labels
+        return self._get_labels_by_mask(np.ones(len(self._label_table), dtype=bool))
 
     def get_miss_errors(self):
-        errors = [label for label in self._labels if label.is_miss_error()]
-        return errors
+        return self._get_labels_by_mask(self._label_table.get_error_mask(Const.ERROR_TYPE_MISS))
 
     def get_background_errors(self):
-        errors = [label for label in self._labels if label.is_background_error()]
-        return errors
+        return self._get_labels_by_mask(
+            self._label_table.get_error_mask(Const.ERROR_TYPE_BACKGROUND)
+        )
 
     def get_location_errors(self):
-        errors = [label for label in self._labels if label.is_location_error()]
-        return errors
+        return self._get_labels_by_mask(
+            self._label_table.get_error_mask(Const.ERROR_TYPE_LOCATION)
+        )
 
     def get_class_errors(self):
-        errors = [label for label in self._labels if label.is_class_error()]
-        return errors
+        return self._get_labels_by_mask(self._label_table.get_error_mask(Const.ERROR_TYPE_CLASS))
 
     def get_duplicate_errors(self):
-        errors = [label for label in self._labels if label.is_duplicate_error()]
-        return errors
+        return self._get_labels_by_mask(
+            self._label_table.get_error_mask(Const.ERROR_TYPE_DUPLICATE)
+        )
 
     def get_both_errors(self):
-        errors = [label for label in self._labels if label.is_both_error()]
-        return errors
+        return self._get_labels_by_mask(self._label_table.get_error_mask(Const.ERROR_TYPE_BOTH))
 
     def get_normal_labels(self):
-        labels = [label for label in self._labels if label.get_error_type() == ""]
-        return labels
+        return self._get_labels_by_mask(self._label_table.get_column("error_type") < 0)
 
     def get_false_positive_count(self):
-        count = 0
-        for predicted_label in self._labels:
-            if predicted_label.is_false_positive():
-                count += 1
-        return count
+        return int(np.count_nonzero(self._label_table.get_false_positive_mask()))
 
     def get_true_positive_count(self):
-        count = 0
-        for predicted_label in self._labels:
-            if predicted_label.is_true_positive():
-                count += 1
-        return count
+        return int(np.count_nonzero(self._label_table.get_true_positive_mask()))
 
     def get_false_negative_count(self):
-        count = 0
-        for predicted_label in self._labels:
-            if predicted_label.is_false_negative():
-                count += 1
-        return count
+        return int(np.count_nonzero(self._label_table.get_false_negative_mask()))
 
     def get_true_positive_count_by_category_id(self, category_id: int):
-        count = 0
-        for label in self._labels:
-            if label.get_pred_category_id() == category_id:
-                if label.is_true_positive():
-                    count += 1
-        return count
+        return int(
+            np.count_nonzero(
+                self._label_table.get_true_positive_mask()
+                & (self._label_table.get_column("pred_category_id") == category_id)
+            )
+        )
+
+    def get_error_count(self, error_type: str):
+        return int(np.count_nonzero(self._label_table.get_error_mask(error_type)))
+
+    def get_summary(self):
+        """
+        [Cls, Loc, Both, Dupe, Bkg, Miss, FP, FN, TP] counts followed by get_correct_distance()
+        """
+        return (
+            [self.get_error_count(error_type) for error_type in Const.MAIN_ERRORS]
+            + [
+                self.get_false_positive_count(),
+                self.get_false_negative_count(),
+                self.get_true_positive_count(),
+            ]
+            + self.get_correct_distance()
+        )
+
+    def get_duplicate_counts(self):
+        """
+        number of duplicate predictions folded into each gt, indexed by gt position
+        """
+        duplicate_counts = np.diff(self._label_table.get_column("duplicate_offsets"))
+        has_duplicate = duplicate_counts > 0
+        return np.bincount(
+            self._label_table.get_column("match_gt_index")[has_duplicate],
+            weights=duplicate_counts[has_duplicate],
+            minlength=len(self._gts),
+        ).astype(np.int64)
 
     def get_correct_distance(self):
         """
         [Cls, Loc, Both, Dupe, Bkg, Miss, No Error, All Errors]
         """
-        correct_distances = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-        for label in self._labels:
-            correct_distances = [
-                x + y for x, y in zip(correct_distances, label.get_correct_distance())
-            ]
-        return correct_distances
+        return self._label_table.get_correct_distance()
 
     def get_correction_cost(self):
         return self.get_correct_distance()[-1]
+
+    def get_label(self, row: int):
+        table = self._label_table
+        pred_label = self._get_pred_label(table.get_column("pred_index")[row])
+        match_gt_category_label = self._get_gt_label(table.get_column("match_gt_index")[row])
+        unmatch_gt_category_label = self._get_gt_label(table.get_column("unmatch_gt_index")[row])
+        label = Label(
+            self.get_image_id(),
+            self.get_image_name(),
+            pred_label,
+            match_gt_category_label,
+            unmatch_gt_category_label,
+            self._iou_threshold,
+            self._confidence_threshold,
+            float(table.get_column("match_gt_category_iou")[row]),
+            float(table.get_column("unmatch_gt_category_iou")[row]),
+        )
+        for pred_index, iou in zip(*table.get_duplicates(row)):
+            label.add_duplicate_pred_labels(self._get_pred_label(pred_index), float(iou))
+        return label
+
+    def _get_labels_by_mask(self, mask: np.ndarray):
+        return [self.get_label(row) for row in np.flatnonzero(mask)]
+
+    def _get_pred_label(self, pred_index: int):
+        if pred_index < 0:
+            return None
+        pred = self._preds[pred_index]
+        return PredLabel(
+            self.get_image_id(),
+            self.get_image_name(),
+            int(pred_index),
+            pred.get("category_id", -1),
+            pred[Const.MODE_BBOX],
+            pred.get("score", -1),
+        )
+
+    def _get_gt_label(self, gt_index: int):
+        if gt_index < 0:
+            return None
+        gt = self._gts[gt_index]
+        return GtLabel(
+            self.get_image_id(),
+            self.get_image_name(),
+            int(gt_index),
+            gt.get("category_id", -1),
+            gt[Const.MODE_BBOX],
+        )
+
+
+def calculate_image_ious(gts: list, preds: list, sparse_box_count: int, gt_bboxes=None):
+    """
+    row: predict, col: gt.
+    dense iou matrix, or (pred indices, gt indices, ious) of intersecting boxes only
+    when the image has more than sparse_box_count boxes.
+    """
+    if gt_bboxes is None:
+        gt_bboxes = create_gt_arrays(gts)[0]
+    pred_bboxes = np.asarray(
+        [pred[Const.MODE_BBOX] for pred in preds], dtype=np.float64
+    ).reshape(-1, 4)
+    if len(gts) + len(preds) > sparse_box_count:
+        return calculate_sparse_ious(gt_bboxes, pred_bboxes)
+    return calculate_iou_matrix(gt_bboxes, pred_bboxes)
@@ -0,0 +1,246 @@
+import math
+
+import numpy as np
+
+import nobunaga.constants as Const
+from nobunaga.evaluator import SUMMARY_COUNT_SIZE, Evaluator
+from nobunaga.io import GtJson, PredJson
+from nobunaga.labels import Image, LabelTable
+from nobunaga.labels.label_table import CORRECT_DISTANCE_SIZE
+from nobunaga.utils import create_id_array, from_saved_id_array, to_saved_id_array
+
+LABEL_TABLE_PREFIX = "label_table_"
+
+
+class PartialResult(object):
+    """
+    evaluation result of a part of the images, which can be saved, merged with the other parts
+    and turned back into an Evaluator.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float,
+        confidence_threshold: float,
+        category_ids: list,
+        image_ids: list,
+        image_summaries,
+        error_count_matrix,
+        confusion_matrix,
+        label_counts=None,
+        label_table: LabelTable = None,
+    ):
+        self._iou_threshold = iou_threshold
+        self._confidence_threshold = confidence_threshold
+        self._category_ids = list(category_ids)
+        self._image_ids = list(image_ids)
+        # row: image, col: Evaluator.get_summary()
+        self._image_summaries = np.asarray(image_summaries, dtype=np.float64).reshape(
+            -1, SUMMARY_COUNT_SIZE + CORRECT_DISTANCE_SIZE
+        )
+        self._error_count_matrix = np.asarray(error_count_matrix, dtype=np.int32)
+        self._confusion_matrix = np.asarray(confusion_matrix, dtype=np.int32)
+        # label_counts[i] rows of label_table per image, in the order of image_ids
+        self._label_counts = label_counts
+        self._label_table = label_table
+
+    @staticmethod
+    def from_evaluator(evaluation: Evaluator, category_ids: list, with_label_table: bool = True):
+        label_counts = None
+        label_table = None
+        if with_label_table:
+            tables = [image.get_label_table() for image in evaluation.iter_images()]
+            label_counts = np.array([len(table) for table in tables], dtype=np.int64)
+            label_table = LabelTable.concatenate(tables)
+        return PartialResult(
+            evaluation.get_iou_threshold(),
+            evaluation.get_confidence_threshold(),
+            category_ids,
+            evaluation.get_image_ids(),
+            [image.get_summary() for image in evaluation.iter_images()],
+            evaluation.get_error_count_matrix(category_ids),
+            evaluation.get_confusion_matrix(category_ids),
+            label_counts,
+            label_table,
+        )
+
+    @staticmethod
+    def load(file_path: str):
+        with np.load(file_path, allow_pickle=False) as data:
+            label_counts = None
+            label_table = None
+            if "label_counts" in data.files:
+                label_counts = data["label_counts"]
+                label_table = LabelTable(
+                    {
+                        name[len(LABEL_TABLE_PREFIX) :]: from_saved_id_array(data[name])
+                        for name in data.files
+                        if name.startswith(LABEL_TABLE_PREFIX)
+                    }
+                )
+            return PartialResult(
+                float(data["iou_threshold"]),
+                float(data["confidence_threshold"]),
+                data["category_ids"].tolist(),
+                data["image_ids"].tolist(),
+                data["image_summaries"],
+                data["error_count_matrix"],
+                data["confusion_matrix"],
+                label_counts,
+                label_table,
+            )
+
+    @staticmethod
+    def merge(partial_results: list):
+        """
+        the merged result is a partial result too, it can be saved and merged again with others,
+        so the matrices are always summed, even when the merge command only outputs the summary.
+        they are (categories x categories) arrays, small next to the image summaries and labels.
+        """
+        if len(partial_results) == 0:
+            raise ValueError("no partial results to merge.")
+        first = partial_results[0]
+        image_ids = []
+        for partial_result in partial_results:
+            if (
+                partial_result.get_iou_threshold() != first.get_iou_threshold()
+                or partial_result.get_confidence_threshold() != first.get_confidence_threshold()
+            ):
+                raise ValueError("partial results of different thresholds can not be merged.")
+            if partial_result.get_category_ids() != first.get_category_ids():
+                raise ValueError("partial results of different categories can not be merged.")
+            image_ids.extend(partial_result.get_image_ids())
+        if len(set(image_ids)) != len(image_ids):
+            raise ValueError("partial results share some images.")
+
+        label_counts = None
+        label_table = None
+        if all(partial_result.has_label_table() for partial_result in partial_results):
+            label_counts = np.concatenate(
+                [partial_result.get_label_counts() for partial_result in partial_results]
+            )
+            label_table = LabelTable.concatenate(
+                [partial_result.get_label_table() for partial_result in partial_results]
+            )
+        return PartialResult(
+            first.get_iou_threshold(),
+            first.get_confidence_threshold(),
+            first.get_category_ids(),
+            image_ids,
+            np.concatenate(
+                [partial_result.get_image_summaries() for partial_result in partial_results]
+            ),
+            sum(partial_result.get_error_count_matrix() for partial_result in partial_results),
+            sum(partial_result.get_confusion_matrix() for partial_result in partial_results),
+            label_counts,
+            label_table,
+        )
+
+    def save(self, file_path: str):
+        data = {
+            "iou_threshold": np.float64(self._iou_threshold),
+            "confidence_threshold": np.float64(self._confidence_threshold),
+            "category_ids": to_saved_id_array(create_id_array(self._category_ids)),
+            "image_ids": to_saved_id_array(create_id_array(self._image_ids)),
+            "image_summaries": self._image_summaries,
+            "error_count_matrix": self._error_count_matrix,
+            "confusion_matrix": self._confusion_matrix,
+        }
+        if self.has_label_table():
+            data["label_counts"] = self._label_counts
+            for name in self._label_table.get_column_names():
+                data[LABEL_TABLE_PREFIX + name] = to_saved_id_array(
+                    self._label_table.get_column(name)
+                )
+        with open(file_path, mode="wb") as f:
+            np.savez_compressed(f, **data)
+
+    def to_evaluator(
+        self,
+        gt: GtJson,
+        pred: PredJson,
+        sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT,
+    ):
+        """
+        images in the order of the gt annotations, as a single Evaluator would create them.
+        """
+        if not self.has_label_table():
+            raise ValueError("partial results saved without label tables can not be evaluated.")
+        label_offsets = np.concatenate([[0], np.cumsum(self._label_counts)])
+        image_positions = {image_id: position for position, image_id in enumerate(self._image_ids)}
+        images = []
+        for image_id in gt.get_annotations().keys():
+            position = image_positions.get(image_id)
+            if position is None:
+                continue
+            images.append(
+                Image(
+                    gt.get_image_by_image_id(image_id),
+                    gt.get_categories(),
+                    gt.get_annotation_by_image_id(image_id),
+                    pred.get_annotation_by_image_id(image_id),
+                    self._iou_threshold,
+                    self._confidence_threshold,
+                    sparse_box_count,
+                    label_table=self._label_table.slice(
+                        label_offsets[position], label_offsets[position + 1]
+                    ),
+                )
+            )
+        return Evaluator(
+            gt,
+            pred,
+            self._iou_threshold,
+            self._confidence_threshold,
+            sparse_box_count,
+            images=images,
+        )
+
+    def has_label_table(self):
+        return self._label_table is not None
+
+    def get_iou_threshold(self):
+        return self._iou_threshold
+
+    def get_confidence_threshold(self):
+        return self._confidence_threshold
+
+    def get_category_ids(self):
+        return list(self._category_ids)
+
+    def get_image_ids(self):
+        return list(self._image_ids)
+
+    def get_image_summaries(self):
+        return self._image_summaries
+
+    def get_label_counts(self):
+        return self._label_counts
+
+    def get_label_table(self):
+        return self._label_table
+
+    def get_error_count_matrix(self):
+        return self._error_count_matrix.copy()
+
+    def get_confusion_matrix(self):
+        return self._confusion_matrix.copy()
+
+    def get_summary(self):
+        """
+        the same as Evaluator.get_summary() of the merged images.
+        """
+        if len(self._image_summaries) == 0:
+            return [0] * SUMMARY_COUNT_SIZE + [0.0] * CORRECT_DISTANCE_SIZE
+        summary = np.cumsum(self._image_summaries, axis=0)[-1].tolist()
+        counts = [int(count) for count in summary[:SUMMARY_COUNT_SIZE]]
+        return counts + summary[SUMMARY_COUNT_SIZE:]
+
+
+def get_shard_image_ids(gt: GtJson, shard_index: int, shard_count: int):
+    """
+    image ids of the shard_index-th of shard_count contiguous parts of the gt annotations.
+    """
+    image_ids = list(gt.get_annotations().keys())
+    shard_size = math.ceil(len(image_ids) / shard_count)
+    return image_ids[shard_index * shard_size : (shard_index + 1) * shard_size]
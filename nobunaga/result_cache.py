@@ -0,0 +1,124 @@
+import hashlib
+import os
+import shutil
+import zipfile
+from pathlib import Path
+
+import nobunaga
+import nobunaga.constants as Const
+from nobunaga.evaluator import Evaluator
+from nobunaga.io import GtJson, PredJson
+from nobunaga.io.binary_annotations import save_binary_annotations
+from nobunaga.partial_result import PartialResult
+
+HASH_CHUNK_SIZE = 1 << 20
+# files of a cached result, in a directory named by its key
+RESULT_FILE_NAME = "result.npz"
+GT_FILE_NAME = "gt" + Const.BINARY_SUFFIX
+PRED_FILE_NAME = "pred" + Const.BINARY_SUFFIX
+
+
+class ResultCache(object):
+    """
+    evaluation results on disk, keyed by the contents of the inputs, the thresholds and the version.
+    a result is the PartialResult of all images with the boxes, image names and categories
+    its labels refer to, the Evaluator is created again from them without reading the inputs.
+    the least recently used results are removed when the cache grows over max_size bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self._cache_dir = Path(cache_dir).expanduser()
+        self._cache_dir.mkdir(exist_ok=True, parents=True)
+        self._max_size = max_size
+
+    def get_key(self, gt_path: str, pred_path: str, parameters: list):
+        """
+        parameters are everything else changing the result, e.g. thresholds.
+        """
+        key_hash = hashlib.sha256()
+        for file_path in [gt_path, pred_path]:
+            key_hash.update(_get_file_hash(file_path).encode())
+        key_hash.update(repr(list(parameters) + [nobunaga.__version__]).encode())
+        return key_hash.hexdigest()
+
+    def load(self, key: str, sparse_box_count: int = Const.THRESHOLD_SPARSE_IOU_BOX_COUNT):
+        result_dir = self._get_result_dir(key)
+        if not result_dir.exists():
+            return None
+        try:
+            gt = GtJson(str(result_dir / GT_FILE_NAME))
+            pred = PredJson(str(result_dir / PRED_FILE_NAME))
+            partial_result = PartialResult.load(str(result_dir / RESULT_FILE_NAME))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        # mark as recently used
+        os.utime(str(result_dir))
+        return partial_result.to_evaluator(gt, pred, sparse_box_count)
+
+    def save(self, key: str, evaluation: Evaluator):
+        result_dir = self._get_result_dir(key)
+        if result_dir.exists():
+            return
+        gt = evaluation.get_gt()
+        pred = evaluation.get_pred()
+        image_ids = evaluation.get_image_ids()
+        # only the file name of each image is needed for the outputs
+        images = {}
+        for image_id in image_ids:
+            image = gt.get_image_by_image_id(image_id)
+            if image:
+                images[image_id] = {
+                    "id": image.get("id", -1),
+                    "file_name": image.get("file_name", ""),
+                }
+
+        # write then rename, readers never see a partial result
+        tmp_dir = self._cache_dir / f"{key}.{os.getpid()}.tmp"
+        tmp_dir.mkdir(exist_ok=True)
+        save_binary_annotations(
+            str(tmp_dir / GT_FILE_NAME),
+            {image_id: gt.get_annotation_by_image_id(image_id) for image_id in image_ids},
+            images,
+            evaluation.get_categories(),
+        )
+        save_binary_annotations(
+            str(tmp_dir / PRED_FILE_NAME),
+            {image_id: pred.get_annotation_by_image_id(image_id) for image_id in image_ids},
+        )
+        PartialResult.from_evaluator(evaluation, list(evaluation.get_categories().keys())).save(
+            str(tmp_dir / RESULT_FILE_NAME)
+        )
+        try:
+            os.replace(str(tmp_dir), str(result_dir))
+        except OSError:
+            # saved by another process in the meantime
+            shutil.rmtree(str(tmp_dir))
+        self._evict()
+
+    def _get_result_dir(self, key: str):
+        return self._cache_dir / key
+
+    def _evict(self):
+        result_dirs = sorted(
+            [path for path in self._cache_dir.iterdir() if path.is_dir() and path.suffix == ""],
+            key=lambda path: path.stat().st_mtime,
+        )
+        result_sizes = [
+            sum(file_path.stat().st_size for file_path in result_dir.iterdir())
+            for result_dir in result_dirs
+        ]
+        total_size = sum(result_sizes)
+        # the newest result is kept even when it is larger than max_size
+        for result_dir, result_size in zip(result_dirs[:-1], result_sizes[:-1]):
+            if total_size <= self._max_size:
+                break
+            total_size -= result_size
+            shutil.rmtree(str(result_dir))
+
+
+def _get_file_hash(file_path: str):
+    file_hash = hashlib.sha256()
+    with open(file_path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
@@ -1,3 +1,5 @@
-from .compute_iou import calculate_iou, calculate_ious
+from .compute_iou import calculate_iou, calculate_iou_matrix, calculate_ious, calculate_paired_ious
+from .id_array import create_id_array, from_saved_id_array, to_saved_id_array
+from .spatial_index import calculate_sparse_ious, get_sparse_ious, sparse_argmax
 
 __all__ = list(globals().keys())
@@ -2,14 +2,64 @@ import numpy as np
 
 
 def calculate_ious(gt_bboxes: list, pred_bboxes: list):
-    iou_matrix = []
-    for pred_bbox in pred_bboxes:
-        iou_row = []
-        for gt_bbox in gt_bboxes:
-            iou = calculate_iou(gt_bbox, pred_bbox)
-            iou_row.append(iou)
-        iou_matrix.append(iou_row)
-    return np.array(iou_matrix)
+    gt_bboxes = np.asarray(gt_bboxes, dtype=np.float64).reshape(-1, 4)
+    pred_bboxes = np.asarray(pred_bboxes, dtype=np.float64).reshape(-1, 4)
+    return calculate_iou_matrix(gt_bboxes, pred_bboxes)
+
+
+def calculate_iou_matrix(gt_bboxes: np.ndarray, pred_bboxes: np.ndarray):
+    """
+    row: pred, col: gt. bboxes are (N, 4) arrays of [x, y, width, height].
+    same branches as calculate_iou so degenerate boxes give identical values.
+    """
+    return _calculate_iou_array(gt_bboxes[None, :, :], pred_bboxes[:, None, :])
+
+
+def calculate_paired_ious(gt_bboxes: np.ndarray, pred_bboxes: np.ndarray):
+    """
+    iou of gt_bboxes[i] and pred_bboxes[i] for each i.
+    """
+    return _calculate_iou_array(gt_bboxes, pred_bboxes)
+
+
+def _calculate_iou_array(gt_bboxes: np.ndarray, pred_bboxes: np.ndarray):
+    pred_left = pred_bboxes[..., 0]
+    pred_right = pred_left + pred_bboxes[..., 2]
+    pred_top = pred_bboxes[..., 1]
+    pred_bottom = pred_top + pred_bboxes[..., 3]
+    gt_left = gt_bboxes[..., 0]
+    gt_right = gt_left + gt_bboxes[..., 2]
+    gt_top = gt_bboxes[..., 1]
+    gt_bottom = gt_top + gt_bboxes[..., 3]
+
+    intersection_left = _select_edge(pred_left, pred_right, gt_left, gt_right, gt_left, pred_left)
+    intersection_right = _select_edge(
+        pred_left, pred_right, gt_left, gt_right, gt_right, pred_right
+    )
+    intersection_top = _select_edge(pred_top, pred_bottom, gt_top, gt_bottom, gt_top, pred_top)
+    intersection_bottom = _select_edge(
+        pred_top, pred_bottom, gt_top, gt_bottom, gt_bottom, pred_bottom
+    )
+    intersection = (intersection_right - intersection_left) * (
+        intersection_bottom - intersection_top
+    )
+    union = (
+        (pred_right - pred_left) * (pred_bottom - pred_top)
+        + (gt_right - gt_left) * (gt_bottom - gt_top)
+        - intersection
+    )
+    iou = np.zeros(intersection.shape, dtype=np.float64)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def _select_edge(pred_start, pred_end, gt_start, gt_end, gt_edge, pred_edge):
+    # gt edge inside pred range, else pred edge inside gt range, else 0
+    return np.where(
+        (pred_start <= gt_edge) & (gt_edge <= pred_end),
+        gt_edge,
+        np.where((gt_start <= pred_edge) & (pred_edge <= gt_end), pred_edge, 0.0),
+    )
 
 
 def calculate_iou(gt_bbox: list, pred_bbox: list):
@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def create_id_array(ids: list):
+    """
+    int64 array of integer ids, object array of any other ids, e.g. strings.
+    """
+    if all(isinstance(id_, (int, np.integer)) for id_ in ids):
+        return np.array(ids, dtype=np.int64)
+    array = np.empty(len(ids), dtype=object)
+    array[:] = list(ids)
+    return array
+
+
+def to_saved_id_array(ids: np.ndarray):
+    """
+    ids which np.load reads without pickle, object arrays are saved as strings.
+    """
+    if ids.dtype == object:
+        return ids.astype(str)
+    return ids
+
+
+def from_saved_id_array(ids: np.ndarray):
+    """
+    ids saved by to_saved_id_array, strings are object arrays again.
+    """
+    if ids.dtype.kind == "U":
+        return ids.astype(object)
+    return ids
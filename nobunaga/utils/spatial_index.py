@@ -0,0 +1,143 @@
+import numpy as np
+
+from .compute_iou import calculate_paired_ious
+
+
+def calculate_sparse_ious(gt_bboxes: np.ndarray, pred_bboxes: np.ndarray):
+    """
+    iou of pred/gt pairs whose boxes intersect, found with a uniform grid.
+    returns (pred_indices, gt_indices, ious) sorted by pred then gt index.
+    pairs that are not returned have an iou of 0.
+    """
+    gt_count = len(gt_bboxes)
+    pred_count = len(pred_bboxes)
+    if gt_count == 0 or pred_count == 0:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float64),
+        )
+
+    gt_extents = _get_extents(gt_bboxes)
+    pred_extents = _get_extents(pred_bboxes)
+
+    # grid over all boxes with about one gt per cell
+    origin = np.minimum(gt_extents[:, :2].min(axis=0), pred_extents[:, :2].min(axis=0))
+    span = np.maximum(gt_extents[:, 2:].max(axis=0), pred_extents[:, 2:].max(axis=0)) - origin
+    cell_count = max(1, int(np.sqrt(gt_count)))
+    cell_size = np.where(span > 0, span / cell_count, 1.0)
+    gt_cells, gt_owners = _get_cells(gt_extents, origin, cell_size, cell_count)
+    pred_cells, pred_owners = _get_cells(pred_extents, origin, cell_size, cell_count)
+
+    # join pred and gt entries of the same cell
+    order = np.argsort(gt_cells, kind="stable")
+    gt_cells = gt_cells[order]
+    gt_owners = gt_owners[order]
+    starts = np.searchsorted(gt_cells, pred_cells, side="left")
+    counts = np.searchsorted(gt_cells, pred_cells, side="right") - starts
+    pred_indices = np.repeat(pred_owners, counts)
+    gt_indices = gt_owners[np.repeat(starts, counts) + _get_local_positions(counts)]
+
+    # boxes spanning several cells meet more than once
+    keys = np.unique(pred_indices * gt_count + gt_indices)
+    pred_indices = keys // gt_count
+    gt_indices = keys % gt_count
+
+    is_intersect = (
+        (gt_extents[gt_indices, 0] <= pred_extents[pred_indices, 2])
+        & (pred_extents[pred_indices, 0] <= gt_extents[gt_indices, 2])
+        & (gt_extents[gt_indices, 1] <= pred_extents[pred_indices, 3])
+        & (pred_extents[pred_indices, 1] <= gt_extents[gt_indices, 3])
+    )
+    pred_indices = pred_indices[is_intersect]
+    gt_indices = gt_indices[is_intersect]
+    ious = calculate_paired_ious(gt_bboxes[gt_indices], pred_bboxes[pred_indices])
+    return pred_indices, gt_indices, ious
+
+
+def sparse_argmax(
+    pred_indices: np.ndarray,
+    gt_indices: np.ndarray,
+    ious: np.ndarray,
+    pred_count: int,
+    gt_count: int,
+):
+    """
+    same (index, value) per row as np.argmax on the dense pred x gt matrix.
+    entries have to be sorted by pred then gt index.
+    """
+    indices = np.zeros(pred_count, dtype=np.int64)
+    values = np.zeros(pred_count, dtype=np.float64)
+    is_nonzero = ious != 0
+    pred_indices = pred_indices[is_nonzero]
+    gt_indices = gt_indices[is_nonzero]
+    ious = ious[is_nonzero]
+    if len(ious) == 0:
+        return indices, values
+
+    # largest iou per row, first gt index on ties
+    order = np.lexsort((gt_indices, -ious, pred_indices))
+    rows = pred_indices[order]
+    best = order[np.concatenate([[True], rows[1:] != rows[:-1]])]
+    best_rows = pred_indices[best]
+    indices[best_rows] = gt_indices[best]
+    values[best_rows] = ious[best]
+
+    # when the maximum is not positive, argmax picks the first zero column
+    row_starts = np.searchsorted(pred_indices, best_rows, side="left")
+    row_ends = np.searchsorted(pred_indices, best_rows, side="right")
+    for position in np.flatnonzero(values[best_rows] <= 0):
+        if row_ends[position] - row_starts[position] == gt_count:
+            continue
+        row = best_rows[position]
+        columns = gt_indices[row_starts[position] : row_ends[position]]
+        missing = np.flatnonzero(columns != np.arange(len(columns)))
+        indices[row] = missing[0] if len(missing) > 0 else len(columns)
+        values[row] = 0.0
+    return indices, values
+
+
+def get_sparse_ious(
+    pred_indices: np.ndarray,
+    gt_indices: np.ndarray,
+    ious: np.ndarray,
+    rows: np.ndarray,
+    columns: np.ndarray,
+    gt_count: int,
+):
+    """
+    iou at each (rows[i], columns[i]), 0 for pairs without an entry.
+    entries have to be sorted by pred then gt index.
+    """
+    values = np.zeros(len(rows), dtype=np.float64)
+    if len(ious) == 0:
+        return values
+    keys = pred_indices * gt_count + gt_indices
+    targets = np.asarray(rows) * gt_count + np.asarray(columns)
+    positions = np.minimum(np.searchsorted(keys, targets), len(keys) - 1)
+    is_found = keys[positions] == targets
+    values[is_found] = ious[positions[is_found]]
+    return values
+
+
+def _get_extents(bboxes: np.ndarray):
+    # [x_min, y_min, x_max, y_max] also for boxes with negative size
+    corners = np.stack([bboxes[:, :2], bboxes[:, :2] + bboxes[:, 2:]])
+    return np.concatenate([corners.min(axis=0), corners.max(axis=0)], axis=1)
+
+
+def _get_cells(extents: np.ndarray, origin: np.ndarray, cell_size: np.ndarray, cell_count: int):
+    first = np.clip(((extents[:, :2] - origin) // cell_size).astype(np.int64), 0, cell_count - 1)
+    last = np.clip(((extents[:, 2:] - origin) // cell_size).astype(np.int64), 0, cell_count - 1)
+    widths = last[:, 0] - first[:, 0] + 1
+    counts = widths * (last[:, 1] - first[:, 1] + 1)
+    owners = np.repeat(np.arange(len(extents)), counts)
+    positions = _get_local_positions(counts)
+    xs = first[owners, 0] + positions % widths[owners]
+    ys = first[owners, 1] + positions // widths[owners]
+    return ys * cell_count + xs, owners
+
+
+def _get_local_positions(counts: np.ndarray):
+    # 0..count-1 for each count, concatenated
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
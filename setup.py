@@ -39,6 +39,7 @@ setup(
     author=author,
     url=url,
     install_requires=_requirements(),
+    extras_require={"parquet": ["pyarrow"]},
     include_package_data=True,
     license="",
     packages=find_packages(exclude=("tests")),
@@ -0,0 +1,89 @@
+import json
+
+from nobunaga.evaluator import Evaluator
+from nobunaga.io import GtJson, PredJson
+from nobunaga.io.binary_annotations import save_binary_annotations
+from nobunaga.partial_result import PartialResult
+
+
+def _write_string_ids(tmp_path, file_name: str):
+    # image and category ids as strings, e.g. "im396863" and "c1"
+    with open(f"test/jsons/{file_name}", "r") as f:
+        coco_json = json.load(f)
+    for image in coco_json.get("images", []):
+        image["id"] = f"im{image['id']}"
+    for category in coco_json.get("categories", []):
+        category["id"] = f"c{category['id']}"
+    for annotation in coco_json.get("annotations", []):
+        annotation["image_id"] = f"im{annotation['image_id']}"
+        for segment in annotation.get("segments_info", []):
+            segment["category_id"] = f"c{segment['category_id']}"
+    file_path = str(tmp_path / file_name)
+    with open(file_path, "w") as f:
+        json.dump(coco_json, f)
+    return file_path
+
+
+def test_string_ids(tmp_path):
+    summary = Evaluator(
+        GtJson("test/jsons/gt_coco.json"), PredJson("test/jsons/pred_coco.json"), 0.5, 0.7
+    ).get_summary()
+
+    gt_path = _write_string_ids(tmp_path, "gt_coco.json")
+    pred_path = _write_string_ids(tmp_path, "pred_coco.json")
+    gt = GtJson(gt_path)
+    pred = PredJson(pred_path)
+    evaluation = Evaluator(gt, pred, 0.5, 0.7)
+    assert evaluation.get_image_ids() == ["im396863"]
+    assert evaluation.get_summary() == summary
+
+    # partial results and binary files keep the string ids
+    category_ids = list(gt.get_categories().keys())
+    partial_path = str(tmp_path / "partial.npz")
+    PartialResult.from_evaluator(evaluation, category_ids).save(partial_path)
+    partial_result = PartialResult.load(partial_path)
+    assert partial_result.get_image_ids() == ["im396863"]
+    assert partial_result.get_category_ids() == category_ids
+    assert partial_result.to_evaluator(gt, pred).get_summary() == summary
+
+    gt.save_binary(str(tmp_path / "gt.nobunaga"))
+    pred.save_binary(str(tmp_path / "pred.nobunaga"))
+    binary_evaluation = Evaluator(
+        GtJson(str(tmp_path / "gt.nobunaga")), PredJson(str(tmp_path / "pred.nobunaga")), 0.5, 0.7
+    )
+    assert binary_evaluation.get_summary() == summary
+    assert binary_evaluation.get_confusion_matrix(category_ids).tolist() == (
+        evaluation.get_confusion_matrix(category_ids).tolist()
+    )
+
+
+def test_pred_only_categories_of_several_preds(tmp_path):
+    gt = GtJson("test/jsons/gt_coco.json")
+    gt_categories = dict(gt.get_categories())
+    pred = PredJson("test/jsons/pred_coco.json")
+    # model a also predicts a category which only its predictions name
+    annotations = {
+        image_id: annotations + [dict(annotations[0], category_id=999)]
+        for image_id, annotations in pred.get_annotations().items()
+    }
+    pred_a_path = str(tmp_path / "a.nobunaga")
+    save_binary_annotations(pred_a_path, annotations, categories={999: "extra"})
+
+    evaluations = dict(
+        Evaluator.iter_by_preds(gt, [pred_a_path, "test/jsons/pred_coco.json"], 0.5, 0.7)
+    )
+    evaluation_a = evaluations[pred_a_path]
+    evaluation_b = evaluations["test/jsons/pred_coco.json"]
+    assert evaluation_a.get_categories()[999] == "extra"
+    assert gt.get_categories() == gt_categories
+    assert evaluation_b.get_categories() == gt_categories
+
+    # model b has the same matrices as when it is evaluated alone
+    evaluation = Evaluator(GtJson("test/jsons/gt_coco.json"), pred, 0.5, 0.7)
+    category_ids = list(evaluation_b.get_categories().keys())
+    assert evaluation_b.get_error_count_matrix(category_ids).tolist() == (
+        evaluation.get_error_count_matrix(list(gt_categories.keys())).tolist()
+    )
+    assert evaluation_b.get_confusion_matrix(category_ids).tolist() == (
+        evaluation.get_confusion_matrix(list(gt_categories.keys())).tolist()
+    )
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import nobunaga.io.json_stream as json_stream
+from nobunaga.io import PredJson
+from nobunaga.io.pred_json import PRED_FIELDS
+
+PANOPTIC_PRED = {
+    "info": {"year": 2017, "version": 1.0, "scale": 1e5, "offset": -2.5e-3},
+    "annotations": [
+        {
+            "image_id": 396863,
+            "file_name": "000000396863.png",
+            "segments_info": [
+                {"id": 12, "category_id": 1, "bbox": [227.5, 280, 15, 1e1], "score": 0.9999},
+                {"id": 2017, "category_id": 2, "bbox": [10, 20.25, 300, 40], "score": 1},
+            ],
+        }
+    ],
+    "categories": [{"id": 1, "name": "person"}, {"id": 2, "name": "bicycle"}],
+}
+
+
+def _get_pred_fields(pred: PredJson):
+    return {
+        image_id: [
+            {field: annotation[field] for field in PRED_FIELDS if field in annotation}
+            for annotation in annotations
+        ]
+        for image_id, annotations in pred.get_annotations().items()
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 7])
+@pytest.mark.parametrize("file_name", ["pred_coco.json", "pred_detectron.json", "panoptic"])
+def test_streaming_pred_across_chunks(tmp_path, monkeypatch, chunk_size, file_name):
+    # numbers cross chunk boundaries at these sizes
+    monkeypatch.setattr(json_stream, "READ_CHUNK_SIZE", chunk_size)
+    file_path = f"test/jsons/{file_name}"
+    if file_name == "panoptic":
+        file_path = str(tmp_path / "pred_panoptic.json")
+        with open(file_path, "w") as f:
+            json.dump(PANOPTIC_PRED, f)
+
+    streaming_pred = PredJson(file_path, streaming=True)
+    assert streaming_pred.get_annotations() == _get_pred_fields(PredJson(file_path))
+    assert len(streaming_pred.get_annotations()) > 0